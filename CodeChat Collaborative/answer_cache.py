@@ -0,0 +1,70 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from vector_store import normalize
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of generated answers. A new question reuses a cached answer when its
+    embedding is at least `threshold` cosine-similar to the cached question and retrieval
+    picked the same `context` key. The caller builds that key from everything besides the
+    question that shapes the answer: the chunks retrieved (by content key) and the history sent.
+    Everything is dropped as soon as the brain version changes (ingest, sync, load).
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # id -> (query vec, context, answer, sources, created)
+        self.by_context = {}           # context -> set of ids
+        self.version = None
+        self.next_id = 0
+        self.hits = self.misses = self.evictions = self.expired = self.invalidations = 0
+
+    def _drop(self, eid):
+        context = self.entries.pop(eid)[1]
+        ids = self.by_context[context]; ids.discard(eid)
+        if not ids: del self.by_context[context]
+
+    def _sync_version(self, version):
+        if version == self.version: return
+        if self.entries: self.invalidations += 1
+        self.entries.clear(); self.by_context.clear(); self.version = version
+
+    def get(self, query_vec, context, version):
+        """Returns (answer, sources) or None"""
+        q = normalize(np.asarray(query_vec, dtype=np.float32))
+        now = time.time()
+        with self.lock:
+            self._sync_version(version)
+            best, best_sim = None, self.threshold
+            for eid in list(self.by_context.get(context, ())):
+                vec, _, ans, srcs, created = self.entries[eid]
+                if now - created > self.ttl: self._drop(eid); self.expired += 1; continue
+                sim = float(vec @ q)
+                if sim >= best_sim: best, best_sim = eid, sim
+            if best is None: self.misses += 1; return None
+            self.hits += 1
+            self.entries.move_to_end(best)
+            return self.entries[best][2], self.entries[best][3]
+
+    def put(self, query_vec, context, version, answer, sources):
+        q = normalize(np.asarray(query_vec, dtype=np.float32))
+        with self.lock:
+            self._sync_version(version)
+            self.next_id += 1
+            self.entries[self.next_id] = (q, context, answer, list(sources), time.time())
+            self.by_context.setdefault(context, set()).add(self.next_id)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries))); self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                    "evictions": self.evictions, "expired": self.expired, "invalidations": self.invalidations}
@@ -1,254 +1,589 @@
 import os
+import time
+import itertools
 import ollama
 import numpy as np
 import pickle
 import zipfile
+import io
 import concurrent.futures
 import requests
 import json
+import base64
+import hashlib
+import secrets
+import threading
+import contextlib
+from embedding import BatchEmbedder, EmbeddingCache, QueryEmbeddingCache
+from vector_store import VectorStore, IVFIndex
+from snapshot import write_snapshot, read_snapshot, is_snapshot, file_sha256
+from chunk_store import ChunkStore
+from lexical_index import LexicalIndex, tokenize, fuse
+from symbol_index import SymbolIndex, extract_symbols, definition_query, query_words, describe
+from chunker import split_code, count_tokens
+from context_packer import pack_context, fit_history
+from scanner import scan_files, map_bounded, is_binary
+from http_client import client
+from answer_cache import AnswerCache
 
-try:
-    from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
-    HAS_LANGCHAIN = True
-except ImportError:
-    HAS_LANGCHAIN = False
+LOCAL_SERVER = "http://localhost:8000"   # the team server a Host runs next to its app
+CODE_EXTENSIONS = {'.py', '.js', '.ts', '.c', '.cpp', '.java', '.md', '.txt', '.json', '.rs', '.go'}
+
+class RWLock:
+    """Many readers or one writer. A waiting writer holds back new readers so ingest cannot starve."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0; self._writer = False; self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers: self._cond.wait()
+            self._readers += 1
+        try: yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers: self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers: self._cond.wait()
+            self._waiting_writers -= 1; self._writer = True
+        try: yield
+        finally:
+            with self._cond:
+                self._writer = False; self._cond.notify_all()
 
 class CoreBrain:
     def __init__(self):
-        self.chunks = []       
-        self.embeddings = []   
-        self.sources = []      
+        # Readers: retrieval. Writer: anything that swaps or appends rows, and the brief step that takes
+        # references for a snapshot; snapshot files and ANN indexes are built with no lock held.
+        # Embedding and LLM calls happen outside the lock so they never block other users.
+        self.lock = RWLock()
+        self.chunks = ChunkStore()     # chunk text + source path per row
+        self.embeddings = VectorStore()
+        self.lexical = LexicalIndex()  # BM25 over identifiers, rows aligned with chunks
+        self.symbols = SymbolIndex()   # function/class definitions per source file
         self.local_history = [] 
+        self.version = secrets.token_hex(8)   # changes whenever rows change; delta syncs must name it
+        self.sync_state = None                # Host side: {url, version, keys} of the last server sync
         self.model = "llama3.1" 
+        self.top_k = 5
+        self.chunk_tokens = 512   # budget per chunk; whole definitions are packed up to it
+        self.num_ctx = 4096       # Ollama context window; the prompt is packed to fit it
+        self.answer_tokens = 768  # kept free for the reply
+        self.context_tokens = 2560  # retrieved code, at most
+        self.history_tokens = 768   # recent chat turns, at most
+        self.fusion_depth = 4     # each retriever proposes top_k * this many rows before fusion
+        self.nprobe = 16          # IVF lists scanned per query: higher = better recall, slower
+        self.ann_min_rows = 50000 # below this, exact search is fast enough
         self.embed_file = "temp_vectors.npy"
         self.meta_file = "temp_metadata.pkl"
+        self.cache_file = "embed_cache.db"
+        self.embedder = BatchEmbedder(batch_size=32, workers=4, cache=EmbeddingCache(self.cache_file))
+        self.query_embedder = QueryEmbeddingCache(max_entries=1024)
+        self.answer_cache = AnswerCache(max_entries=1000, ttl=3600, threshold=0.95)
+
+    def _split_text(self, content, file_path, symbols=None):
+        return split_code(content, file_path, self.chunk_tokens, min_chars=0, symbols=symbols)
+
+    def _index_file(self, content, file_path):
+        """Returns (path, chunks, symbols) for one file's text"""
+        syms = extract_symbols(content, file_path)
+        return file_path, self._split_text(content, file_path, syms), syms
 
     def _read_file(self, file_path):
+        """Returns (path, chunks, symbols)"""
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            if not content.strip(): return []
-            
-            if HAS_LANGCHAIN:
-                ext = os.path.splitext(file_path)[1]
-                lang_map = {'.py': Language.PYTHON, '.js': Language.JS, '.ts': Language.TS}
-                lang = lang_map.get(ext, Language.PYTHON)
-                splitter = RecursiveCharacterTextSplitter.from_language(
-                    language=lang, chunk_size=1000, chunk_overlap=100
-                )
-                docs = splitter.create_documents([content])
-                return [(d.page_content, file_path) for d in docs]
-            
-            return [(content, file_path)]
-        except: return []
+            with open(file_path, 'rb') as f: raw = f.read()
+            if is_binary(raw): return file_path, [], []
+            return self._index_file(raw.decode('utf-8', errors='ignore'), file_path)
+        except: return file_path, [], []
 
     def ingest_codebase(self, folder_path, callback_fn, append_mode=False):
         if not append_mode:
-            self.chunks = []; self.embeddings = []; self.sources = []; self.local_history = []
+            with self.lock.write(): self.chunks = ChunkStore(); self.embeddings = VectorStore(); self.lexical = LexicalIndex(); self.symbols = SymbolIndex(); self.local_history = []; self._bump()
             callback_fn("🧹 Memory wiped. Starting fresh...")
         
-        files = []
-        valid = {'.py', '.js', '.ts', '.c', '.cpp', '.java', '.md', '.txt', '.json', '.rs', '.go'}
-        for r, d, f in os.walk(folder_path):
-            if any(x in r for x in ['node_modules', '.git', 'venv', '__pycache__']): continue
-            for file in f:
-                if os.path.splitext(file)[1] in valid:
-                    files.append(os.path.join(r, file))
-
-        if not files: return "No new files found."
-        
-        callback_fn(f"📖 Reading {len(files)} files...")
+        callback_fn("📖 Scanning and reading files...")
         data = []
-        with concurrent.futures.ThreadPoolExecutor() as ex:
-            res = ex.map(self._read_file, files)
-            for r in res: data.extend(r)
+        symbols = {}
+        for path, chunks, syms in map_bounded(self._read_file, scan_files(folder_path, CODE_EXTENSIONS)):
+            data.extend(chunks); symbols[path] = syms
+        if not symbols: return "No new files found."
         
-        return self._embed_data(data, callback_fn)
+        return self._embed_data(data, callback_fn, symbols)
 
     def ingest_remote_data(self, file_data_list, callback_fn, append_mode=True):
         if not append_mode:
-            self.chunks = []; self.embeddings = []; self.sources = []; self.local_history = []
+            with self.lock.write(): self.chunks = ChunkStore(); self.embeddings = VectorStore(); self.lexical = LexicalIndex(); self.symbols = SymbolIndex(); self.local_history = []; self._bump()
             callback_fn("🧹 Server Brain Wiped (Single Mode Active)")
-        return self._embed_data(file_data_list, callback_fn)
+        # Collaborators upload whole files; split them here the same way _read_file does
+        def index(fd):
+            try: return self._index_file(*fd)
+            except Exception as e: callback_fn(f"⚠️ Skipped {fd[1]}: {e}"); return None   # one bad file must not fail the batch
+        data = []
+        symbols = {}
+        with concurrent.futures.ThreadPoolExecutor() as ex:
+            for res in ex.map(index, file_data_list):
+                if res is None: continue
+                path, chunks, syms = res
+                data.extend(chunks); symbols[path] = syms
+        return self._embed_data(data, callback_fn, symbols)
 
-    def _embed_data(self, data_tuples, callback_fn):
+    def _embed_data(self, data_tuples, callback_fn, symbols=None):
         total = len(data_tuples)
         callback_fn(f"🧠 Embedding {total} chunks...")
+        vecs = self.embedder.embed(self.model, [c for c, _ in data_tuples], callback_fn)
         new_vecs = []
+        tokens = [tokenize(c) if v is not None else None for (c, _), v in zip(data_tuples, vecs)]
         
-        for i, (chunk, path) in enumerate(data_tuples):
-            try:
-                self.chunks.append(chunk)
-                self.sources.append(path)
-                resp = ollama.embeddings(model=self.model, prompt=chunk)
-                new_vecs.append(resp['embedding'])
-                if i % 5 == 0: callback_fn(f"⚡ Processing: {int((i/total)*100)}%")
-            except: pass
-            
-        if new_vecs:
-            new_np = np.array(new_vecs)
-            if len(self.embeddings) == 0:
-                self.embeddings = new_np
-            else:
-                self.embeddings = np.concatenate((self.embeddings, new_np), axis=0)
+        with self.lock.write():
+            for (chunk, path), vec in zip(data_tuples, vecs):
+                if vec is None: continue
+                self.chunks.append(chunk, path)
+                new_vecs.append(vec)
+            if new_vecs: self.embeddings.append(new_vecs); self.lexical.add(t for t in tokens if t is not None); self._bump()
+            for path, syms in (symbols or {}).items(): self.symbols.set_file(path, syms)
+        self._refresh_lexical()
+        self._refresh_index(callback_fn)
         
         return f"Success: Indexed {total} chunks."
 
+    def _bump(self): self.version = secrets.token_hex(8)
+
+    def _refresh_index(self, callback_fn):
+        # k-means runs on a view of the current rows with no lock held; only the swap blocks queries.
+        # Rows appended meanwhile sit past n_indexed and are scanned exactly; a compaction renumbers
+        # rows, so an index built before one is thrown away.
+        with self.lock.read():
+            emb = self.embeddings
+            matrix, epoch, live, stale = emb.matrix, emb.epoch, emb.live, emb.index_is_stale()
+        if live < self.ann_min_rows:
+            if emb.index is not None:
+                with self.lock.write(): emb.index = None
+            return
+        if not stale: return
+        callback_fn(f"🗂️ Building ANN index over {live} chunks...")
+        index = IVFIndex.build(matrix)
+        with self.lock.write():
+            if emb.epoch == epoch: emb.index = index
+
+    def _refresh_lexical(self):
+        # merge() rewrites the postings arrays, so unlike the ANN rebuild it cannot run beside searches
+        with self.lock.write():
+            if self.lexical.merge_is_due(): self.lexical.merge()
+
+    def _compact(self):
+        keep = self.embeddings.compact()
+        if len(keep) < len(self.chunks): self.chunks = self.chunks.take(keep)
+        if len(keep) < len(self.lexical): self.lexical.remap(keep)
+
+    def _replace_file(self, tmp_path, filepath):
+        try: os.replace(tmp_path, filepath)
+        except PermissionError:
+            # Windows refuses to replace a file that is still memory-mapped
+            with self.lock.write():
+                self.embeddings.detach(); self.chunks.detach(); self.lexical.detach(); os.replace(tmp_path, filepath)
+
     def save_snapshot(self, filepath):
         try:
-            if len(self.embeddings) == 0: return "Error: Brain is empty."
-            np.save(self.embed_file, self.embeddings)
-            with open(self.meta_file, 'wb') as f:
-                pickle.dump({'chunks': self.chunks, 'sources': self.sources}, f)
-            with zipfile.ZipFile(filepath, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-                zf.write(self.embed_file); zf.write(self.meta_file)
-            if os.path.exists(self.embed_file): os.remove(self.embed_file)
-            if os.path.exists(self.meta_file): os.remove(self.meta_file)
+            if self.embeddings.live == 0: return "Error: Brain is empty."
+            with self.lock.write():
+                # Only references and copies of the growable columns are taken here: none of these
+                # arrays is edited in place later, so the file is written without holding the lock
+                self._compact()
+                sections = {'vectors': self.embeddings.matrix, **self.chunks.sections()}
+                if self.embeddings.index is not None:
+                    sections.update({f"ann_{k}": v for k, v in self.embeddings.index.state().items()})
+                sections.update({f"lex_{k}": v for k, v in self.lexical.state().items()})
+                sections.update(self.symbols.state())
+            write_snapshot(filepath + ".tmp", sections)
+            del sections
+            self._replace_file(filepath + ".tmp", filepath)
             return "Success"
         except Exception as e: return str(e)
 
-    def load_snapshot(self, filepath):
+    def sync_server(self, url, callback_fn=None):
+        """Sends the server only what changed since the last sync, or the whole brain if it cannot"""
+        st = self.sync_state
+        if st and st['url'] == url and st['version']:
+            res = self._push_delta(url, st, callback_fn)
+            if res is not None: return res
+        return self.push_snapshot(url, callback_fn)
+
+    def _push_delta(self, url, st, callback_fn=None):
+        """Returns None when a full upload is needed (server changed meanwhile, or most rows are new)"""
+        with self.lock.read():
+            alive = self.embeddings.alive
+            keys, first = np.unique(self.chunks.key_array()[alive], return_index=True)
+            rows = np.flatnonzero(alive)[first]
+            rows = rows[~np.isin(keys, st['keys'])]
+            removed = np.setdiff1d(st['keys'], keys)
+            if len(rows) * 2 > len(keys): return None
+            if not len(rows) and not len(removed): return "Success"   # nothing to send
+            sources = {self.chunks.source(i) for i in rows}
+            payload = {
+                "base_version": st['version'],
+                "removed": [int(k) for k in removed],
+                "chunks": [{"text": self.chunks[i], "source": self.chunks.source(i)} for i in rows],
+                "vectors_b64": base64.b64encode(np.ascontiguousarray(self.embeddings.matrix[rows]).tobytes()).decode('ascii'),
+                "symbols": {p: self.symbols.files[p] for p in sources if p in self.symbols.files},
+            }
+        if callback_fn: callback_fn(f"📤 Sending {len(rows)} new / {len(removed)} removed chunks...")
         try:
-            if not os.path.exists(filepath): return "File not found"
-            self.chunks = []; self.sources = []; self.embeddings = []
-            with zipfile.ZipFile(filepath, 'r') as zf: zf.extractall(".")
-            self.embeddings = np.load(self.embed_file)
-            with open(self.meta_file, 'rb') as f:
-                d = pickle.load(f)
-                self.chunks = d['chunks']; self.sources = d['sources']
-            if os.path.exists(self.embed_file): os.remove(self.embed_file)
-            if os.path.exists(self.meta_file): os.remove(self.meta_file)
+            r = client(url).post("/sync_brain/delta", json=payload)
+            if r.status_code == 409:
+                if callback_fn: callback_fn("♻️ Server brain changed since last sync, sending full brain...")
+                return None
+            if r.status_code != 200: return f"Server Reject: {r.text}"
+        except Exception as e: return f"Upload Failed: {e}"
+        self.sync_state = {'url': url, 'version': r.json()['version'], 'keys': keys}
+        return "Success"
+
+    def apply_delta(self, base_version, removed, data_tuples, vectors, callback_fn, symbols=None):
+        """
+        Server side of sync_server: drops rows whose chunk_key is in `removed` and appends the new
+        rows in place. Returns None if the brain changed since `base_version`, else the new version.
+        `symbols` replaces the definition table of the files the new rows came from.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(data_tuples): vectors = vectors.reshape(len(data_tuples), -1)
+        tokens = [tokenize(c) for c, _ in data_tuples]
+        with self.lock.write():
+            if base_version != self.version: return None
+            if not len(removed) and not len(data_tuples): return self.version   # nothing changed: keep the answer cache
+            if len(data_tuples) and self.embeddings.dim and vectors.shape[1] != self.embeddings.dim:
+                raise ValueError(f"Embedding size {vectors.shape[1]} does not match brain ({self.embeddings.dim})")
+            if len(removed): self.embeddings.delete(np.flatnonzero(np.isin(self.chunks.key_array(), np.asarray(removed, dtype=np.uint64))))
+            if len(data_tuples):
+                for chunk, path in data_tuples: self.chunks.append(chunk, path)
+                self.embeddings.append(vectors)
+                self.lexical.add(tokens)
+            for path, syms in (symbols or {}).items(): self.symbols.set_file(path, syms)
+            if len(removed): self.symbols.keep_only(self.chunks.live_sources(self.embeddings.alive))
+            self._bump()
+            version = self.version
+        self._refresh_lexical()
+        self._refresh_index(callback_fn)
+        return version
+
+    def push_snapshot(self, url, callback_fn=None, chunk_size=4 * 1024 * 1024, retries=3):
+        """
+        Uploads the brain to a team server as checksummed binary chunks. The server reports which
+        chunks of this exact snapshot it already holds, so a failed sync resumes where it stopped.
+        """
+        tmp = "temp_sync.brain"
+        res = self.save_snapshot(tmp)
+        if "Success" not in res: return f"Save Failed: {res}"
+        with self.lock.read(): keys = np.unique(self.chunks.key_array()[self.embeddings.alive])
+        try:
+            s = client(url)
+            r = s.post("/sync_brain/start", json={"size": os.path.getsize(tmp), "sha256": file_sha256(tmp), "chunk_size": chunk_size})
+            if r.status_code != 200: return f"Server Reject: {r.text}"
+            info = r.json()
+            missing, chunk_size = info['missing'], info['chunk_size']
+            with open(tmp, 'rb') as f:
+                for n, i in enumerate(missing):
+                    f.seek(i * chunk_size); data = f.read(chunk_size)
+                    headers = {"x-chunk-sha256": hashlib.sha256(data).hexdigest()}
+                    err = ""
+                    for _ in range(retries):
+                        try:
+                            r = s.put(f"/sync_brain/{info['upload_id']}/{i}", data=data, headers=headers)
+                            if r.status_code == 200: err = ""; break
+                            err = r.text
+                        except requests.RequestException as e: err = str(e)
+                    if err: return f"Upload Failed (chunk {i}): {err}"
+                    if callback_fn: callback_fn(f"📤 Uploading brain: {int((n + 1) / len(missing) * 100)}%")
+            if callback_fn: callback_fn("🔁 Server is switching to the new brain...")
+            r = s.post(f"/sync_brain/{info['upload_id']}/finish", timeout=(5, 600))
+            if r.status_code != 200: return f"Server Reject: {r.text}"
+            self.sync_state = {'url': url, 'version': r.json().get('version'), 'keys': keys}
             return "Success"
+        except Exception as e: return f"Upload Failed: {e}"
+        finally:
+            if os.path.exists(tmp): os.remove(tmp)
+
+    def replace_snapshot(self, tmp_path, filepath):
+        """Moves a freshly written snapshot over `filepath` and loads it"""
+        try: self._replace_file(tmp_path, filepath)
         except Exception as e: return str(e)
+        return self.load_snapshot(filepath)
 
-    def get_team_chat(self):
+    def load_snapshot(self, filepath, mmap=True):
         try:
-            res = requests.get("http://localhost:8000/team_activity", timeout=0.5)
-            if res.status_code == 200: return res.json()['history']
-            return []
-        except: return []
+            if not os.path.exists(filepath): return "File not found"
+            if not is_snapshot(filepath): return self._load_zip_snapshot(filepath)
+            s = read_snapshot(filepath, mmap)
+            embeddings = VectorStore.from_matrix(s['vectors'])
+            if 'ann_centroids' in s:
+                embeddings.index = IVFIndex.from_state({k[4:]: v for k, v in s.items() if k.startswith('ann_')})
+            if 'chunk_blob' in s: chunks = ChunkStore.from_sections(s)
+            else:
+                d = pickle.loads(s['meta'].tobytes())
+                chunks = ChunkStore.from_lists(d['chunks'], d['sources'])
+            if 'lex_terms' in s: lexical = LexicalIndex.from_state({k[4:]: v for k, v in s.items() if k.startswith('lex_')})
+            else: lexical = LexicalIndex.build(chunks[i] for i in range(len(chunks)))
+            symbols = SymbolIndex.from_state(s) if 'symbols' in s else SymbolIndex()
+            with self.lock.write():
+                self.embeddings = embeddings; self.chunks = chunks; self.lexical = lexical; self.symbols = symbols; self._bump()
+            return "Success"
+        except Exception as e: return str(e)
 
-    def get_connected_users(self):
-        try:
-            res = requests.get("http://localhost:8000/active_users", timeout=0.5)
-            if res.status_code == 200: return res.json()['users']
-            return []
-        except: return []
+    def _load_zip_snapshot(self, filepath):
+        """Reads the original zip(npy + pickle) .brain format"""
+        with zipfile.ZipFile(filepath, 'r') as zf:
+            vecs = np.load(io.BytesIO(zf.read(self.embed_file)))
+            d = pickle.loads(zf.read(self.meta_file))
+        embeddings, chunks = VectorStore(vecs), ChunkStore.from_lists(d['chunks'], d['sources'])
+        lexical = LexicalIndex.build(d['chunks'])
+        with self.lock.write():
+            self.embeddings = embeddings; self.chunks = chunks; self.lexical = lexical; self.symbols = SymbolIndex(); self._bump()
+        return "Success"
 
-    def ask_question(self, query, history=None, is_public=False):
-        if not self.chunks or len(self.embeddings) == 0: 
-            return "❌ Brain is empty. Please load code on Host and click Sync.", []
+    def team_events(self, since=0, epoch=""):
+        """Push feed of the local team server: ('epoch', None, {'epoch'}), then ('activity', id, entry) and ('presence', None, {'users'})"""
+        return client(LOCAL_SERVER).events("/team_stream", params={"since": since, "epoch": epoch})
+
+    def find_symbol(self, name, limit=50):
+        """Where `name` is defined: [{name, kind, path, line, definition}]"""
+        with self.lock.read(): return self.symbols.lookup(name, limit)
+
+    def definition_answer(self, query):
+        """(answer, sources) for "where is X defined?" straight from the symbol table, else None"""
+        name = definition_query(query)
+        hits = self.find_symbol(name) if name else []
+        if not hits: return None
+        return describe(name, hits), list(dict.fromkeys(h['path'] for h in hits))
+
+    def _definition_rows(self, hits, limit=20):
+        """Live chunk rows holding the definition line of each hit (caller holds the read lock)"""
+        wanted = {}
+        for h in hits[:limit]: wanted.setdefault(h['path'], []).append(h['definition'].encode('utf-8', errors='ignore'))
+        alive = self.embeddings.alive
+        return [i for path, defs in wanted.items() for i in self.chunks.find_in_source(path, defs) if alive[i]]
+
+    def _budget_prompt(self, preamble, query, history):
+        """Returns (history messages to send, tokens left for retrieved context)"""
+        hist = fit_history(history, self.history_tokens)
+        spent = count_tokens(preamble) + count_tokens(query) + sum(count_tokens(m['content']) + 4 for m in hist)
+        return hist, max(0, min(self.context_tokens, self.num_ctx - self.answer_tokens - spent))
+
+    def ask_question(self, query, history=None, is_public=False, plan=None):
+        ans, srcs = "", []
+        for ev in self.ask_question_stream(query, history, is_public, plan):
+            if 'sources' in ev: srcs = ev['sources']
+            if 'token' in ev: ans += ev['token']
+            if 'error' in ev: return ev['error'], []
+        return ans, srcs
+
+    def prepare_answer(self, query, history=None):
+        """
+        Everything that comes before generation: the symbol-table answer, retrieval and the
+        answer cache. Returns {'answer', 'sources'} when no LLM call is needed, {'error'}, or
+        the prompt ({'messages', 'sources', ...}) to generate from. The server runs this before
+        it claims an LLM slot, so direct and cached answers never wait behind generations.
+        """
+        if not self.chunks or self.embeddings.live == 0: 
+            return {'error': "❌ Brain is empty. Please load code on Host and click Sync."}
 
         active_history = history if history is not None else self.local_history
 
-        try:
-            q_vec = np.array(ollama.embeddings(model=self.model, prompt=query)['embedding'])
-            sims = np.dot(self.embeddings, q_vec)
-            top_idx = np.argsort(sims)[-5:][::-1]
-            ctx = "\n\n".join([self.chunks[i] for i in top_idx])
-            srcs = [self.sources[i] for i in top_idx]
-        except Exception as e: return f"❌ Retrieval Error: {str(e)}", []
-
-        system_msg = (
+        direct = self.definition_answer(query)
+        if direct is not None: return {'answer': direct[0], 'sources': direct[1]}
+
+        preamble = (
             "You are an expert Developer. "
             "Use the provided Context to answer the user's technical question. "
-            f"\n\nContext:\n{ctx}"
+            "\n\nContext:\n"
         )
+        recent, budget = self._budget_prompt(preamble, query, active_history)
+
+        try:
+            q_vec = self.query_embedder.embed(self.model, query)
+            with self.lock.read():
+                depth = self.top_k * self.fusion_depth
+                vec_rows, _ = self.embeddings.search(q_vec, depth, self.nprobe)
+                lex_rows, _ = self.lexical.search(query, self.embeddings.alive, depth)
+                sym_rows = self._definition_rows(self.symbols.mentioned(query_words(query)))
+                ranked = fuse([vec_rows, lex_rows, sym_rows], depth)
+                ctx, used, srcs = pack_context([(i, self.chunks.source(i), self.chunks[i]) for i in ranked], budget)
+                context = tuple(int(k) for k in self.chunks.key_array()[np.asarray(used, dtype=np.int64)])
+                version = self.version
+        except Exception as e:
+            return {'error': f"❌ Retrieval Error: {str(e)}"}
+
+        # the history sent along shapes the answer as much as the context does
+        context = (hashlib.blake2b(json.dumps(recent).encode('utf-8'), digest_size=8).hexdigest(),) + context
+        cached = self.answer_cache.get(q_vec, context, version)
+        if cached is not None: return {'answer': cached[0], 'sources': cached[1]}
 
-        msgs = [{'role': 'system', 'content': system_msg}]
-        msgs.extend(active_history[-4:]) 
+        msgs = [{'role': 'system', 'content': preamble + ctx}]
+        msgs.extend(recent) 
         msgs.append({'role': 'user', 'content': query})
+        return {'messages': msgs, 'sources': srcs, 'q_vec': q_vec, 'context': context, 'version': version}
 
-        try:
-            res = ollama.chat(
-                model=self.model, 
-                messages=msgs,
-                options={'num_ctx': 4096},
-                stream=False 
-            )
-            ans = res['message']['content']
-            
-            active_history.append({'role': 'user', 'content': query})
-            active_history.append({'role': 'assistant', 'content': ans})
-            
-            if is_public:
-                try: requests.post("http://localhost:8000/host_log", json={"query": query, "answer": ans}, timeout=0.5)
-                except: pass
-            
-            return ans, srcs
-        except Exception as e: return f"AI Error: {e}", []
+    def ask_question_stream(self, query, history=None, is_public=False, plan=None):
+        """
+        Generator version of ask_question. Yields {'sources': [...]} once retrieval is done,
+        then {'token': str} pieces as Ollama produces them, or a single {'error': str}.
+        Near-duplicate questions over the same context are answered from answer_cache in one token.
+        The cache key covers the chat history sent along, so in practice only a question asked at
+        the start of a session (empty history) can be answered from another session's cache entry.
+        `plan` is a prepare_answer() result the caller already has for this query and history.
+        """
+        active_history = history if history is not None else self.local_history
+        if plan is None: plan = self.prepare_answer(query, active_history)
+        if 'error' in plan: yield {'error': plan['error']}; return
+        yield {'sources': plan['sources']}
+
+        if 'answer' in plan:
+            ans = plan['answer']; yield {'token': ans}
+        else:
+            ans = ""
+            try:
+                for part in ollama.chat(model=self.model, messages=plan['messages'], options={'num_ctx': self.num_ctx}, stream=True):
+                    tok = part['message']['content']
+                    if tok:
+                        ans += tok
+                        yield {'token': tok}
+            except Exception as e:
+                yield {'error': f"AI Error: {e}"}; return
+            if ans: self.answer_cache.put(plan['q_vec'], plan['context'], plan['version'], ans, plan['sources'])
+        self._finish_answer(query, ans, active_history, is_public)
+
+    def _finish_answer(self, query, ans, active_history, is_public):
+        active_history.append({'role': 'user', 'content': query})
+        active_history.append({'role': 'assistant', 'content': ans})
+        
+        if is_public:
+            try: client(LOCAL_SERVER).post("/host_log", json={"query": query, "answer": ans})
+            except: pass
 
 class RemoteBrain:
     def __init__(self, url, token):
         self.url = url.rstrip('/')
         self.token = token
         self.chunks = [1] 
+        self.api = client(self.url, token)
+        self.upload_batch_bytes = 2 * 1024 * 1024
+        self.upload_inflight = 4
+        self.upload_retries = 3
 
     def ask_question(self, query, history=None, is_public=False):
         try:
-            headers = {"x-access-token": self.token}
             payload = {"text": query, "public": is_public}
-            res = requests.post(f"{self.url}/query", json=payload, headers=headers, timeout=60)
+            res = self.api.post("/query", json=payload)
             if res.status_code == 200:
                 d = res.json()
                 return d.get('answer', 'Error'), d.get('sources', [])
             return f"❌ Server Error: {res.text}", []
         except Exception as e: return f"❌ Connection Error: {e}", []
 
-    def get_team_chat(self):
+    def ask_question_stream(self, query, history=None, is_public=False):
+        """Reads the server's /query_stream SSE feed and yields the same events as CoreBrain.ask_question_stream"""
         try:
-            headers = {"x-access-token": self.token}
-            res = requests.get(f"{self.url}/team_activity", headers=headers, timeout=2)
-            if res.status_code == 200: return res.json()['history']
-            return []
-        except: return []
+            payload = {"text": query, "public": is_public}
+            with self.api.post("/query_stream", json=payload, stream=True) as res:
+                if res.status_code != 200:
+                    yield {'error': f"❌ Server Error: {res.text}"}; return
+                res.encoding = 'utf-8'
+                for line in res.iter_lines(decode_unicode=True):
+                    if line and line.startswith("data: "): yield json.loads(line[6:])
+        except Exception as e: yield {'error': f"❌ Connection Error: {e}"}
 
-    def get_connected_users(self):
+    def team_events(self, since=0, epoch=""):
+        return self.api.events("/team_stream", params={"since": since, "epoch": epoch})
+
+    def find_symbol(self, name, limit=50):
         try:
-            headers = {"x-access-token": self.token}
-            res = requests.get(f"{self.url}/active_users", headers=headers, timeout=2)
-            if res.status_code == 200: return res.json()['users']
+            res = self.api.get("/symbols", params={"name": name, "limit": limit})
+            if res.status_code == 200: return res.json()['symbols']
             return []
         except: return []
 
+    @staticmethod
+    def _upload_entry(path, folder_path):
+        try:
+            with open(path, 'rb') as f: raw = f.read()
+            if is_binary(raw): return None
+            content = raw.decode('utf-8', errors='ignore')
+            # the path inside the folder, not the basename: two utils.py must not share a source
+            rel = os.path.relpath(path, folder_path).replace(os.sep, "/")
+            return {"text": content, "source": f"RemoteUpload/{rel}"} if content.strip() else None
+        except: return None
+
+    def _iter_files(self, folder_path):
+        """Upload entries for every code file, read in parallel while the scan is still running"""
+        for fd in map_bounded(lambda p: self._upload_entry(p, folder_path), scan_files(folder_path, CODE_EXTENSIONS), inflight=32):
+            if fd: yield fd
+
+    def _iter_batches(self, files):
+        """Groups files into batches of about `upload_batch_bytes` (one big file may go alone)"""
+        batch, size = [], 0
+        for fd in files:
+            n = len(fd['text'].encode('utf-8', errors='ignore'))   # the batch limit is on bytes sent, not characters
+            if batch and size + n > self.upload_batch_bytes:
+                yield batch, size; batch, size = [], 0
+            batch.append(fd); size += n
+        if batch: yield batch, size
+
+    def _post_batch(self, batch, append_mode):
+        # /ingest appends, and a timed-out request may still have been stored: the server runs each
+        # batch_id once, so a retry waits for (or reuses) the first attempt instead of adding it twice
+        err, batch_id = "", secrets.token_hex(16)
+        for attempt in range(self.upload_retries):
+            if attempt: time.sleep(2 ** attempt)
+            try:
+                res = self.api.post("/ingest", json={"chunks": batch, "append_mode": append_mode, "batch_id": batch_id})
+                if res.status_code == 200: return ""
+                err = res.text
+                if res.status_code < 500: break   # rejected, retrying won't help
+            except requests.RequestException as e: err = f"Connection Lost: {e}"
+        return err or "Upload failed"
+
     def ingest_codebase(self, folder_path, callback_fn, append_mode=True):
+        """
+        Streams files to the server in byte-sized batches, keeping `upload_inflight` batches in
+        flight. The first batch goes alone so a Single Mode wipe happens before anything is added.
+        """
         callback_fn("📤 Scanning files...")
-        files_data = []
-        valid = {'.py', '.js', '.ts', '.c', '.cpp', '.java', '.md', '.txt', '.json', '.rs', '.go'}
-        for r, d, f in os.walk(folder_path):
-            if any(x in r for x in ['node_modules', '.git', 'venv']): continue
-            for file in f:
-                if os.path.splitext(file)[1] in valid:
-                    try:
-                        with open(os.path.join(r, file), 'r', encoding='utf-8', errors='ignore') as fo:
-                            content = fo.read()
-                        if content.strip():
-                            files_data.append({"text": content, "source": f"RemoteUpload/{file}"})
-                    except: pass
-        
-        if not files_data: return "No valid files found."
-        
-        total = len(files_data)
-        batch_size = 5
-        callback_fn(f"🚀 Uploading {total} files in batches...")
-        headers = {"x-access-token": self.token}
-        
-        for i in range(0, total, batch_size):
-            batch = files_data[i : i + batch_size]
-            try:
-                payload = {"chunks": batch, "append_mode": append_mode}
-                res = requests.post(f"{self.url}/ingest", json=payload, headers=headers, timeout=30)
-                if res.status_code != 200: return f"❌ Failed at file {i}: {res.text}"
-                callback_fn(f"✅ Uploaded {min(i + batch_size, total)}/{total}")
-            except Exception as e: return f"❌ Connection Lost: {e}"
-            
+        batches = self._iter_batches(self._iter_files(folder_path))
+        first = next(batches, None)
+        if first is None: return "No valid files found."
+
+        callback_fn("🚀 Uploading files in batches...")
+        err = self._post_batch(first[0], append_mode)
+        if err: return f"❌ Upload failed: {err}"
+        files, sent = len(first[0]), first[1]
+        callback_fn(f"✅ Uploaded {files} files ({sent / 1e6:.1f} MB)")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.upload_inflight) as ex:
+            pending = {}
+            for batch, size in itertools.chain(batches, [(None, 0)]):
+                if batch is not None: pending[ex.submit(self._post_batch, batch, True)] = (len(batch), size)
+                while pending and (len(pending) >= self.upload_inflight or batch is None):
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for fut in done:
+                        n, size_done = pending.pop(fut)
+                        err = fut.result()
+                        if err:
+                            for f in pending: f.cancel()
+                            return f"❌ Upload failed after {files} files: {err}"
+                        files += n; sent += size_done
+                        callback_fn(f"✅ Uploaded {files} files ({sent / 1e6:.1f} MB)")
+
         return "✅ All Files Uploaded Successfully"
 
     # --- NEW: Downloads brain from Server ---
     def save_snapshot(self, filepath):
         try:
-            headers = {"x-access-token": self.token}
-            res = requests.get(f"{self.url}/download_brain", headers=headers, stream=True, timeout=60)
+            # Vectors barely compress, so skip the server's gzip for this one
+            res = self.api.get("/download_brain", headers={"Accept-Encoding": "identity"}, stream=True)
             if res.status_code == 200:
                 with open(filepath, 'wb') as f:
                     for chunk in res.iter_content(chunk_size=8192):
@@ -260,5 +595,5 @@ class RemoteBrain:
             return f"Download Failed: {e}"
 
     # --- RESTRICTED: Collaborators cannot load local files into Remote Brain ---
-    def load_snapshot(self, *args): 
+    def load_snapshot(self, *args, **kwargs): 
         return "❌ Permission Denied: Only Host can load Brains."
\ No newline at end of file
@@ -0,0 +1,132 @@
+import hashlib
+from array import array
+import numpy as np
+
+
+def chunk_key(data, source):
+    """64-bit content hash of one row (UTF-8 text + source path)"""
+    h = hashlib.blake2b(source.encode('utf-8', errors='ignore') + b"\0" + data, digest_size=8)
+    return int.from_bytes(h.digest(), 'little')
+
+
+class ChunkStore:
+    """
+    Columnar chunk metadata: every chunk's text lives in one UTF-8 blob addressed by
+    `offsets`, and each chunk points at a deduplicated source path through an int32 id.
+    Texts are decoded only when indexed, so a loaded brain never materializes them all.
+    Arrays may be snapshot memmaps; they are copied into growable buffers on first append.
+    `keys` holds a chunk_key per row so two brains can be diffed without comparing texts;
+    snapshots written before it existed get their keys computed on first use.
+    `by_source` maps a source id to its rows; it is kept up to date on append and built
+    on first use for a loaded store, so rows_for() never scans the whole column.
+    """
+
+    def __init__(self, blob=None, offsets=None, source_ids=None, source_table=None, keys=None):
+        self.blob = bytearray() if blob is None else blob
+        self.offsets = array('q', [0]) if offsets is None else offsets
+        self.source_ids = array('i') if source_ids is None else source_ids
+        self.source_table = list(source_table or [])
+        self.source_index = {p: i for i, p in enumerate(self.source_table)}
+        self.keys = array('Q') if keys is None and not len(self.source_ids) else keys
+        self.by_source = {} if not len(self.source_ids) else None
+
+    @classmethod
+    def from_lists(cls, chunks, sources):
+        store = cls()
+        for chunk, path in zip(chunks, sources): store.append(chunk, path)
+        return store
+
+    def __len__(self): return len(self.source_ids)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self): raise IndexError(i)
+        if i < 0: i += len(self)
+        return self._raw(i).decode('utf-8', errors='ignore')
+
+    def source(self, i):
+        return self.source_table[self.source_ids[i]]
+
+    def _raw(self, i): return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def key_array(self):
+        if self.keys is None:
+            self.keys = array('Q', (chunk_key(self._raw(i), self.source(i)) for i in range(len(self))))
+        return np.asarray(self.keys, dtype=np.uint64)
+
+    def detach(self):
+        """Copies memory-mapped columns into growable in-RAM buffers"""
+        if isinstance(self.blob, bytearray): return
+        keys = self.key_array()
+        self.blob = bytearray(self.blob)
+        self.offsets = array('q', np.asarray(self.offsets, dtype=np.int64).tobytes())
+        self.source_ids = array('i', np.asarray(self.source_ids, dtype=np.int32).tobytes())
+        self.keys = array('Q', keys.tobytes())
+
+    def _append_raw(self, data, source, key=None):
+        sid = self.source_index.get(source)
+        if sid is None:
+            sid = self.source_index[source] = len(self.source_table)
+            self.source_table.append(source)
+        self.blob += data
+        self.offsets.append(len(self.blob))
+        if self.by_source is not None: self.by_source.setdefault(sid, array('q')).append(len(self.source_ids))
+        self.source_ids.append(sid)
+        self.keys.append(chunk_key(data, source) if key is None else key)
+
+    def append(self, chunk, source):
+        self.detach()
+        self._append_raw(chunk.encode('utf-8', errors='ignore'), source)
+
+    def _source_rows(self):
+        if self.by_source is None:
+            ids = np.asarray(self.source_ids, dtype=np.int32)
+            order = np.argsort(ids, kind='stable')
+            bounds = np.searchsorted(ids[order], np.arange(len(self.source_table) + 1))
+            self.by_source = {sid: array('q', order[bounds[sid]:bounds[sid + 1]].astype(np.int64).tobytes())
+                              for sid in range(len(self.source_table)) if bounds[sid] < bounds[sid + 1]}
+        return self.by_source
+
+    def rows_for(self, sources):
+        """Row numbers of every chunk that came from one of `sources`"""
+        by_source = self._source_rows()
+        parts = [np.array(by_source[self.source_index[p]], dtype=np.int64) for p in sources if self.source_index.get(p) in by_source]
+        if not parts: return np.zeros(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+    def find_in_source(self, source, needles):
+        """Rows of `source` whose text contains any of the `needles` (bytes), without decoding them"""
+        out = []
+        for i in self.rows_for([source]):
+            raw = self._raw(i)
+            if any(n in raw for n in needles): out.append(int(i))
+        return out
+
+    def live_sources(self, alive=None):
+        """Source paths that still own at least one chunk (optionally under a row mask)"""
+        ids = np.asarray(self.source_ids, dtype=np.int32)
+        if alive is not None: ids = ids[alive]
+        return {self.source_table[i] for i in np.unique(ids)}
+
+    def take(self, rows):
+        """New store holding only `rows`, with unused source paths dropped"""
+        out = ChunkStore()
+        keys = self.key_array()
+        for i in rows: out._append_raw(self._raw(i), self.source(i), int(keys[i]))
+        return out
+
+    def sections(self):
+        """Snapshot columns; growable buffers are copied, so the store can take appends while they are written"""
+        table = "\0".join(self.source_table).encode('utf-8')
+        blob = self.blob[:self.offsets[len(self)]]
+        return {
+            'chunk_blob': np.frombuffer(bytes(blob) if isinstance(blob, bytearray) else blob, dtype=np.uint8),
+            'chunk_offsets': np.array(self.offsets, dtype=np.int64),
+            'chunk_source_ids': np.array(self.source_ids, dtype=np.int32),
+            'source_table': np.frombuffer(table, dtype=np.uint8),
+            'chunk_keys': np.array(self.key_array()),
+        }
+
+    @classmethod
+    def from_sections(cls, s):
+        table = s['source_table'].tobytes().decode('utf-8')
+        return cls(s['chunk_blob'], s['chunk_offsets'], s['chunk_source_ids'], table.split("\0") if table else [], s.get('chunk_keys'))
@@ -0,0 +1,118 @@
+import re
+from symbol_index import extract_symbols, normalize_newlines
+
+_TOKEN = re.compile(r"[A-Za-z]+|[0-9]+|[^\sA-Za-z0-9]")
+_LEAD = re.compile(r"^\s*(?:@|#|//|/\*|\*|--|\"\"\"|''')")   # decorators / comments that belong to the next definition
+_MAX_CHARS_PER_TOKEN = 4   # a line longer than this many chars per budget token is cut even if it counts few tokens
+
+
+def count_tokens(text):
+    """Cheap estimate of LLM tokens: words, numbers and punctuation marks each count as one"""
+    return len(_TOKEN.findall(text))
+
+
+def _boundaries(lines, symbols):
+    """Line indexes where a unit starts: each definition, pulled up over its decorators/comments"""
+    starts = {0}
+    for _, _, line, _ in symbols:
+        i = line - 1
+        while i > 0 and lines[i - 1].strip() and _LEAD.match(lines[i - 1]): i -= 1
+        starts.add(i)
+    return sorted(s for s in starts if s < len(lines))
+
+
+def _paragraphs(lines):
+    """Fallback units for prose/config files: runs of lines separated by blank lines"""
+    return [0] + [i for i in range(1, len(lines)) if lines[i].strip() and not lines[i - 1].strip()]
+
+
+def _hard_split(line, max_tokens):
+    """Pieces of one line that is over the budget by itself (minified code, one-line JSON), cut between tokens"""
+    limit = (max_tokens - 1) * _MAX_CHARS_PER_TOKEN
+    pieces, start, used = [], 0, 0
+    for m in _TOKEN.finditer(line):
+        if m.start() > start and (used >= max_tokens - 1 or m.end() - start > limit):
+            pieces.append(line[start:m.start()]); start, used = m.start(), 0
+        used += 1
+    pieces.append(line[start:])
+    # a single token can still be too long (a base64 or hex blob): those are cut by characters
+    return [p[i:i + limit] for p in pieces for i in range(0, max(len(p), 1), limit)]
+
+
+def _split_unit(lines, costs, max_tokens):
+    """Cuts one oversized unit into line ranges under the budget, preferring blank lines as cut points"""
+    parts, start, used, last_blank = [], 0, 0, None
+    for i, line in enumerate(lines):
+        if used + costs[i] > max_tokens and i > start:
+            cut = last_blank + 1 if last_blank is not None and last_blank > start else i
+            parts.append((start, cut))
+            start, used, last_blank = cut, sum(costs[cut:i]), None
+            if used + costs[i] > max_tokens and i > start:   # the lines carried over from the blank still leave no room
+                parts.append((start, i)); start, used = i, 0
+        used += costs[i]
+        if not line.strip(): last_blank = i
+    parts.append((start, len(lines)))
+    return parts
+
+
+def split_code(content, path, max_tokens=512, min_chars=50, symbols=None):
+    """
+    Splits a file into chunks that start at definition boundaries (functions, classes, types),
+    packing whole definitions together until `max_tokens` and only cutting a definition that
+    is bigger than the budget on its own; a single line over the budget is cut mid-line.
+    Each chunk gets a header line naming the file and the symbols it holds, so retrieval
+    and the LLM both see where the code came from; `max_tokens` covers the header too.
+    Returns [(chunk, path)].
+    """
+    if not content.strip(): return []
+    content = normalize_newlines(content)   # symbol line numbers count a lone \r as a line end too
+    lines = content.split('\n')
+    if symbols is None: symbols = extract_symbols(content, path)
+    starts = _boundaries(lines, symbols) if symbols else _paragraphs(lines)
+    costs = [count_tokens(l) + 1 for l in lines]   # +1 for the newline
+    # room for the longest header a chunk can get: the path plus up to 8 of the file's symbol names
+    header = count_tokens(f"# File: {path} | Symbols:") + sum(sorted(count_tokens(s[0]) + 1 for s in symbols)[-8:])
+    max_tokens = max(max_tokens - header - 1, max_tokens // 4)
+
+    pos, cont = None, None           # file line -> index in `lines`; True where a piece continues the line before
+    too_long = lambda line, cost: cost > max_tokens or len(line) > max_tokens * _MAX_CHARS_PER_TOKEN
+    if any(map(too_long, lines, costs)):
+        pos, cont, pieces = [], [], []
+        for line, cost in zip(lines, costs):
+            pos.append(len(pieces))
+            cut = _hard_split(line, max_tokens) if too_long(line, cost) else [line]
+            pieces.extend(cut); cont.extend([False] + [True] * (len(cut) - 1))
+        starts = [pos[s] for s in starts]
+        # pieces of a long token count by length too, or a few of them would pack into one huge chunk
+        lines, costs = pieces, [max(count_tokens(l), len(l) // _MAX_CHARS_PER_TOKEN) + 1 for l in pieces]
+    at = (lambda n: pos[n - 1]) if pos else (lambda n: n - 1)   # index of 1-based file line n
+    names = {}                       # first line index of a unit -> symbol names defined in it
+    for name, _, line, _ in symbols: names.setdefault(at(line), []).append(name)
+
+    units = []                       # (start, end, tokens)
+    for a, b in zip(starts, starts[1:] + [len(lines)]):
+        t = sum(costs[a:b])
+        if t <= max_tokens: units.append((a, b, t)); continue
+        for x, y in _split_unit(lines[a:b], costs[a:b], max_tokens):
+            units.append((a + x, a + y, sum(costs[a + x:a + y])))
+
+    chunks, cur, used = [], None, 0
+    for a, b, t in units:
+        if cur is not None and used + t > max_tokens:
+            chunks.append(cur); cur = None
+        if cur is None: cur, used = [a, b], 0
+        cur[1] = b; used += t
+    if cur is not None: chunks.append(cur)
+
+    out = []
+    for a, b in chunks:
+        if cont is None: body = "\n".join(lines[a:b]).strip('\n')
+        else: body = "".join(("\n" if i > a and not cont[i] else "") + lines[i] for i in range(a, b)).strip('\n')
+        if not body.strip() or len(body.strip()) < min_chars: continue
+        held = [n for i in range(a, b) for n in names.get(i, ())]
+        if not held:   # a piece of a long definition: name the one it belongs to
+            owner = [s[0] for s in symbols if at(s[2]) < a]
+            held = owner[-1:]
+        header = f"# File: {path}" + (f" | Symbols: {', '.join(held[:8])}" if held else "")
+        out.append((header + "\n" + body, path))
+    return out
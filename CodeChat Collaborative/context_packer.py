@@ -0,0 +1,109 @@
+import re
+from chunker import count_tokens
+
+_HEADER = re.compile(r"^# File: .*?(?: \| Symbols: (.*))?$")
+
+
+def _split_header(text):
+    """(symbols, body) of a chunk, minus the header line split_code puts on it"""
+    first, _, rest = text.partition('\n')
+    m = _HEADER.match(first)
+    if not m: return [], text.strip('\n')
+    return ([s.strip() for s in m.group(1).split(',')] if m.group(1) else []), rest.strip('\n')
+
+
+def _overlap(a, b, min_len=16, window=2000):
+    """Length of the longest suffix of `a` that is also a prefix of `b` (0 if under min_len)"""
+    if len(b) < min_len: return 0
+    probe, best = b[:min_len], 0
+    i = a.find(probe, max(0, len(a) - window))
+    while i != -1:
+        n = len(a) - i
+        if n <= len(b) and b.startswith(a[i:]): best = n; break
+        i = a.find(probe, i + 1)
+    return best
+
+
+class _Piece:
+    def __init__(self, row, source, symbols, body):
+        self.rows, self.source, self.symbols, self.body = [row], source, list(symbols), body
+        self.tokens = self.cost(self.symbols, body)
+
+    def header(self, symbols=None):
+        symbols = self.symbols if symbols is None else symbols
+        return f"# File: {self.source}" + (f" | Symbols: {', '.join(symbols[:8])}" if symbols else "")
+
+    def cost(self, symbols, body): return count_tokens(self.header(symbols)) + count_tokens(body) + 2
+
+    def render(self): return self.header() + "\n" + self.body
+
+    def join(self, first, last, body):
+        """Merged body if rows first..last overlap or sit right next to this piece in its file, else None"""
+        if body in self.body: return self.body
+        if self.body in body: return body
+        n = _overlap(self.body, body)
+        if n or first == max(self.rows) + 1: return self.body + ("" if n else "\n") + body[n:]
+        n = _overlap(body, self.body)
+        if n or last == min(self.rows) - 1: return body + ("" if n else "\n") + self.body[n:]
+        return None
+
+    def absorb(self, rows, symbols, merged):
+        syms = self.symbols + [s for s in symbols if s not in self.symbols]
+        cost = self.cost(syms, merged)
+        self.body, self.symbols, self.tokens = merged, syms, cost
+        self.rows.extend(rows)
+
+
+def pack_context(candidates, budget):
+    """
+    Builds the prompt context from best-first (row, source, text) candidates without
+    exceeding `budget` estimated tokens. Chunks of the same file that repeat, overlap or
+    are adjacent are merged into one piece, so shared text is only paid for once; a
+    candidate that does not fit is skipped in favour of smaller ones further down.
+    Returns (context text, rows used, sources in order).
+    """
+    pieces, used = [], 0
+    for row, source, text in candidates:
+        symbols, body = _split_header(text)
+        if not body.strip(): continue
+        for p in pieces:
+            if p.source != source: continue
+            merged = p.join(row, row, body)
+            if merged is None: continue
+            before = p.tokens
+            if used - before + p.cost(p.symbols + symbols, merged) > budget: break
+            p.absorb([row], symbols, merged)
+            used += p.tokens - before
+            # the new chunk may close the gap to another piece of the same file
+            for q in [q for q in pieces if q is not p and q.source == source]:
+                merged = p.join(min(q.rows), max(q.rows), q.body)
+                if merged is None: continue
+                before = p.tokens + q.tokens
+                p.absorb(q.rows, q.symbols, merged)
+                pieces.remove(q); used += p.tokens - before
+            break
+        else:
+            p = _Piece(row, source, symbols, body)
+            if used + p.tokens <= budget: pieces.append(p); used += p.tokens
+            elif not pieces and not used:
+                # the best chunk alone is over budget: keep as many of its lines as fit
+                keep, left = [], budget - p.cost(p.symbols, "")
+                for line in body.split('\n'):
+                    left -= count_tokens(line) + 1
+                    if left < 0: break
+                    keep.append(line)
+                if keep:
+                    p.body = "\n".join(keep); p.tokens = p.cost(p.symbols, p.body)
+                    pieces.append(p); used += p.tokens
+    rows = list(dict.fromkeys(r for p in pieces for r in p.rows))
+    return "\n\n".join(p.render() for p in pieces), rows, [p.source for p in pieces]
+
+
+def fit_history(history, budget, max_messages=4):
+    """The newest messages of `history` (at most max_messages) that fit in `budget` tokens"""
+    out = []
+    for msg in reversed(history[-max_messages:]):
+        budget -= count_tokens(msg['content']) + 4
+        if budget < 0: break
+        out.append(msg)
+    return out[::-1]
@@ -0,0 +1,139 @@
+import time
+import hashlib
+import sqlite3
+import threading
+import concurrent.futures
+from collections import OrderedDict
+import numpy as np
+import ollama
+
+
+class EmbeddingCache:
+    """On-disk embedding store keyed by sha256(model, text), capped at `max_entries` with LRU eviction."""
+
+    def __init__(self, path="embed_cache.db", max_entries=500000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS vecs (key BLOB PRIMARY KEY, vec BLOB, used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS vecs_used ON vecs (used)")
+        self.db.commit()
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8', errors='ignore')).digest()
+
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self.db.execute(f"SELECT key, vec FROM vecs WHERE key IN ({','.join('?' * len(part))})", part).fetchall()
+                for k, v in rows: found[bytes(k)] = np.frombuffer(v, dtype=np.float32)
+            self.db.executemany("UPDATE vecs SET used = ? WHERE key = ?", [(now, k) for k in found])
+            self.db.commit()
+        return found
+
+    def put_many(self, items):
+        if not items: return
+        now = time.time()
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO vecs VALUES (?, ?, ?)",
+                                [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items])
+            over = self.db.execute("SELECT COUNT(*) FROM vecs").fetchone()[0] - self.max_entries
+            if over > 0:
+                self.db.execute("DELETE FROM vecs WHERE key IN (SELECT key FROM vecs ORDER BY used LIMIT ?)", (over,))
+            self.db.commit()
+
+
+class QueryEmbeddingCache:
+    """In-process LRU of question embeddings keyed by (model, whitespace-normalized text)."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self.miss_seconds = 0.0   # time spent in Ollama on misses, i.e. what a hit saves on average
+
+    def embed(self, model, text):
+        text = " ".join(text.split())
+        key = (model, text)
+        with self.lock:
+            vec = self.entries.get(key)
+            if vec is not None:
+                self.hits += 1; self.entries.move_to_end(key)
+                return vec
+        start = time.time()
+        vec = ollama.embeddings(model=model, prompt=text)['embedding']
+        with self.lock:
+            self.misses += 1; self.miss_seconds += time.time() - start
+            self.entries[key] = vec
+            while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+        return vec
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                    "avg_miss_ms": round(self.miss_seconds / self.misses * 1000, 1) if self.misses else 0.0}
+
+
+class BatchEmbedder:
+    """Sends chunks to Ollama in batches, keeping at most `workers` requests in flight."""
+
+    def __init__(self, batch_size=32, workers=4, cache=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.cache = cache
+
+    def _embed_batch(self, model, texts):
+        try:
+            vecs = ollama.embed(model=model, input=texts)['embeddings']
+            if len(vecs) == len(texts): return list(vecs)
+        except: pass
+        # Older Ollama builds lack /api/embed, and one bad chunk fails the whole batch
+        out = []
+        for t in texts:
+            try: out.append(ollama.embeddings(model=model, prompt=t)['embedding'])
+            except: out.append(None)
+        return out
+
+    def embed(self, model, texts, callback_fn=None):
+        """Returns one vector per text, in input order. Failed chunks come back as None."""
+        results = [None] * len(texts)
+        keys = []
+        pending = list(range(len(texts)))
+        if self.cache is not None:
+            keys = [EmbeddingCache.key(model, t) for t in texts]
+            hits = self.cache.get_many(keys)
+            pending = [i for i, k in enumerate(keys) if k not in hits]
+            for i, k in enumerate(keys):
+                if k in hits: results[i] = hits[k]
+            if hits and callback_fn: callback_fn(f"♻️ Reused {len(texts) - len(pending)} cached embeddings")
+
+        total = len(pending)
+        if not total: return results
+
+        start = time.time()
+        done = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as ex:
+            futures = {}
+            for i in range(0, total, self.batch_size):
+                batch = pending[i:i + self.batch_size]
+                futures[ex.submit(self._embed_batch, model, [texts[j] for j in batch])] = batch
+            for fut in concurrent.futures.as_completed(futures):
+                batch = futures[fut]
+                fresh = []
+                for j, vec in zip(batch, fut.result()):
+                    results[j] = vec
+                    if vec is not None and keys: fresh.append((keys[j], vec))
+                if self.cache is not None: self.cache.put_many(fresh)
+                done += len(batch)
+                if callback_fn:
+                    rate = done / max(time.time() - start, 1e-6)
+                    callback_fn(f"⚡ Processing: {int(done / total * 100)}% ({rate:.0f} chunks/s)")
+        return results
@@ -0,0 +1,84 @@
+import gzip
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts per endpoint; anything not listed gets DEFAULT_TIMEOUT
+TIMEOUTS = {
+    "/host_log": (0.5, 1),
+    "/logout": (1, 2),
+    "/check_role": (2, 5),
+    "/symbols": (2, 5),
+    "/generate_invite": (2, 5),
+    "/query": (5, 120),
+    "/query_stream": (5, 60),
+    "/team_stream": (5, 45),     # server pings every 15 s
+    "/ingest": (5, 300),
+    "/download_brain": (5, 300),
+    "/sync_brain/start": (5, 10),
+    "/sync_brain/delta": (5, 120),
+}
+DEFAULT_TIMEOUT = (5, 60)
+GZIP_MIN_BYTES = 4096   # smaller JSON bodies are sent as-is
+
+
+class TeamClient:
+    """
+    Keep-alive session for one team server. Every backend HTTP call goes through one of these,
+    so polling and uploads reuse pooled connections instead of opening a socket per call.
+    Large JSON bodies are gzipped; responses are gzipped by the server and inflated by requests.
+    """
+
+    def __init__(self, url, token=None, pool_size=16):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if token: self.session.headers["x-access-token"] = token
+
+    def request(self, method, path, json_body=None, headers=None, **kw):
+        kw.setdefault("timeout", TIMEOUTS.get(path, DEFAULT_TIMEOUT))
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers["Content-Type"] = "application/json"
+            if len(body) >= GZIP_MIN_BYTES:
+                body = gzip.compress(body, compresslevel=5); headers["Content-Encoding"] = "gzip"
+            kw["data"] = body
+        return self.session.request(method, self.url + path, headers=headers, **kw)
+
+    def get(self, path, **kw): return self.request("GET", path, **kw)
+    def post(self, path, json=None, **kw): return self.request("POST", path, json, **kw)
+    def put(self, path, **kw): return self.request("PUT", path, **kw)
+
+    def events(self, path, **kw):
+        """Yields (event, id, data) from a text/event-stream endpoint until the server closes it"""
+        with self.get(path, stream=True, **kw) as res:
+            res.raise_for_status()
+            res.encoding = 'utf-8'
+            event, event_id, data = "message", None, []
+            # chunk_size=None hands over each chunk as it arrives instead of waiting for 512 bytes
+            for line in res.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line:
+                    if data: yield event, event_id, json.loads("\n".join(data))
+                    event, event_id, data = "message", None, []
+                    continue
+                field, _, value = line.partition(":")
+                if value.startswith(" "): value = value[1:]
+                if field == "event": event = value
+                elif field == "id": event_id = value
+                elif field == "data": data.append(value)
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def client(url, token=None):
+    """Shared TeamClient for (url, token)"""
+    key = (url.rstrip('/'), token)
+    with _lock:
+        if key not in _clients: _clients[key] = TeamClient(url, token)
+        return _clients[key]
@@ -2,22 +2,38 @@ import sys
 import os
 import markdown
 import speech_recognition as sr
-import requests
 import json
-import base64
 import zipfile
 import shutil
+import html
 from datetime import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QTextBrowser, QLineEdit, QPushButton, 
                              QFileDialog, QLabel, QFrame, QInputDialog, QMessageBox, 
                              QDialog, QRadioButton, QTextEdit, QTabWidget, 
                              QListWidget)
-from PyQt6.QtCore import QThread, pyqtSignal, Qt, QTimer
-from backend import CoreBrain, RemoteBrain
+from PyQt6.QtCore import QThread, pyqtSignal, Qt
+from PyQt6.QtGui import QTextCursor
+from backend import CoreBrain, RemoteBrain, LOCAL_SERVER
+from http_client import client
 from styles import PRO_STYLE, STATUS_LOCAL, STATUS_REMOTE, STATUS_GUEST, STATUS_COLLAB
 
 TEXT_GRAY = "#888888"
+TEAM_VIEW_MAX_BLOCKS = 5000   # oldest Team Stream lines are dropped past this, so the view stays cheap
+
+def team_entry_html(h):
+    color = "#5865F2" if "HOST" in h['user'] else "#F59E0B"
+    return f"""
+        <div style="margin-bottom: 15px; padding: 10px; background-color: #0f0f0f; border-radius: 8px; border: 1px solid #222;">
+            <div style="color:{color}; font-size: 10px; font-weight: bold; margin-bottom: 5px;">👤 {html.escape(h['user'])}</div>
+            <div style="background-color: #1a1a1a; padding: 8px; border-radius: 6px; margin-bottom: 5px; border-left: 2px solid {color};">
+                <span style="color: #ccc; font-weight: bold;">Q:</span> <span style="color: #fff; white-space: pre-wrap;">{html.escape(h['query'])}</span>
+            </div>
+            <div style="background-color: #111; padding: 8px; border-radius: 6px; color: #aaa; font-size: 12px; white-space: pre-wrap;">
+                <span style="color: #5865F2; font-weight: bold;">AI:</span> {html.escape(h['answer'])}
+            </div>
+        </div>
+        """
 
 class VoiceLoop(QThread):
     update_status = pyqtSignal(str); speech_recognized = pyqtSignal(str); 
@@ -53,8 +69,44 @@ class VoiceLoop(QThread):
     def resume(self): self.paused = False
     def stop(self): self.is_running = False
 
+class TeamFeed(QThread):
+    """
+    Follows the team server's /team_stream, reconnecting from the last entry id it has seen.
+    Entries are rendered to HTML here, off the GUI thread; the replay sent on (re)connect is
+    emitted as one batch (the server ends it with a presence event) so it is a single insert.
+    Ids only count up within one server run: a new epoch means the view has to start over.
+    """
+    entries_signal = pyqtSignal(int, str); presence_signal = pyqtSignal(list); reset_signal = pyqtSignal()
+
+    def __init__(self, brain):
+        super().__init__(); self.brain = brain; self.is_running = True; self.last_id = 0; self.epoch = ""
+
+    def run(self):
+        while self.is_running:
+            batch, replaying = [], True
+            try:
+                for event, event_id, data in self.brain.team_events(self.last_id, self.epoch):
+                    if not self.is_running: return
+                    if event == "epoch":
+                        if self.epoch and data['epoch'] != self.epoch:   # server restarted, its ids start from 1 again
+                            self.last_id = 0; self.reset_signal.emit()
+                        self.epoch = data['epoch']
+                    elif event == "activity" and data['id'] > self.last_id:
+                        self.last_id = data['id']; batch.append(team_entry_html(data))
+                    elif event == "presence":
+                        replaying = False; self.presence_signal.emit(data['users'])
+                    if batch and (not replaying or len(batch) >= 200):
+                        self.entries_signal.emit(self.last_id, "".join(batch)); batch = []
+            except Exception: pass
+            if batch: self.entries_signal.emit(self.last_id, "".join(batch))
+            for _ in range(20):   # server down or restarting: retry every 2 s
+                if not self.is_running: return
+                self.msleep(100)
+
+    def stop(self): self.is_running = False
+
 class TaskWorker(QThread):
-    msg_signal = pyqtSignal(str); result_signal = pyqtSignal(object)
+    msg_signal = pyqtSignal(str); result_signal = pyqtSignal(object); token_signal = pyqtSignal(str)
     
     def __init__(self, brain, task, data=None, append_mode=False, extra=None, public_flag=False, history=None):
         super().__init__(); self.brain = brain; self.task = task; self.data = data; 
@@ -89,7 +141,7 @@ class TaskWorker(QThread):
                 try:
                     with zipfile.ZipFile(self.data, 'r') as zf: zf.extractall("temp_session_extract")
                     if os.path.exists("temp_session_extract/temp_session_brain.brain"):
-                        load_res = self.brain.load_snapshot("temp_session_extract/temp_session_brain.brain")
+                        load_res = self.brain.load_snapshot("temp_session_extract/temp_session_brain.brain", mmap=False)
                         if "Success" not in load_res: raise Exception(load_res)
                     chat_data = []
                     if os.path.exists("temp_session_extract/temp_session_chat.json"):
@@ -100,24 +152,20 @@ class TaskWorker(QThread):
                 finally:
                     if os.path.exists("temp_session_extract"): shutil.rmtree("temp_session_extract")
             elif self.task == "query": 
-                res = self.brain.ask_question(self.data, history=self.history, is_public=self.public_flag)
+                ans, srcs = "", []
+                for ev in self.brain.ask_question_stream(self.data, history=self.history, is_public=self.public_flag):
+                    if 'sources' in ev: srcs = ev['sources']
+                    if 'token' in ev: ans += ev['token']; self.token_signal.emit(ev['token'])
+                    if 'error' in ev: ans, srcs = ev['error'], []
+                res = (ans, srcs)
             elif self.task == "sync_server":
                 if not isinstance(self.brain, CoreBrain): res = "ERROR|Cannot sync from Remote Mode"
                 else:
-                    temp_file = "temp_sync.brain"; save_res = self.brain.save_snapshot(temp_file)
-                    if "Success" not in save_res: res = f"ERROR|Save Failed: {save_res}"
-                    else:
-                        try:
-                            with open(temp_file, "rb") as f: b64_data = base64.b64encode(f.read()).decode('utf-8')
-                            resp = requests.post("http://localhost:8000/sync_brain", json={"b64_data": b64_data}, timeout=30)
-                            if resp.status_code == 200: res = "SUCCESS|Synced"
-                            else: res = f"ERROR|Server Reject: {resp.text}"
-                        except Exception as e: res = f"ERROR|Upload Failed: {e}"
-                        finally: 
-                            if os.path.exists(temp_file): os.remove(temp_file)
+                    sync_res = self.brain.sync_server(LOCAL_SERVER, self.msg_signal.emit)
+                    res = "SUCCESS|Synced" if sync_res == "Success" else f"ERROR|{sync_res}"
             elif self.task == "invite":
                 try:
-                    resp = requests.post("http://localhost:8000/generate_invite", json={"email": self.data, "role": self.extra})
+                    resp = client(LOCAL_SERVER).post("/generate_invite", json={"email": self.data, "role": self.extra})
                     if resp.status_code == 200: res = f"SUCCESS|{resp.json()['token']}"
                     else: res = f"ERROR|{resp.text}"
                 except: res = "ERROR|Server Offline"
@@ -147,8 +195,8 @@ class TokenPopup(QDialog):
 class CoreApp(QMainWindow):
     def __init__(self):
         super().__init__(); self.brain = CoreBrain(); self.voice_thread = None; self.chat_history_log = [] 
-        self.init_ui(); self.team_timer = QTimer(); self.team_timer.timeout.connect(self.poll_updates)
-        self.team_timer.start(2000) 
+        self.team_feed = None; self.old_feeds = []
+        self.init_ui(); self.start_team_feed()
 
     def init_ui(self):
         self.setWindowTitle("CodeChat Pro - Team Edition"); self.resize(1100, 700)
@@ -192,6 +240,7 @@ class CoreApp(QMainWindow):
         self.tabs = QTabWidget()
         self.chat = QTextBrowser(); self.chat.setOpenExternalLinks(True)
         self.team_view = QTextBrowser(); self.team_view.setOpenExternalLinks(True)
+        self.team_view.document().setMaximumBlockCount(TEAM_VIEW_MAX_BLOCKS)
         self.tabs.addTab(self.chat, "💬 My Session (Private)")
         self.tabs.addTab(self.team_view, "👥 Team Stream (Public)")
         center_layout.addWidget(self.tabs)
@@ -224,35 +273,33 @@ class CoreApp(QMainWindow):
             self.btn_mode.setText("⚡ Single Mode")
             self.btn_mode.setStyleSheet("color: #aaa; font-style: italic; border: 1px dashed #444;")
 
-    def poll_updates(self):
-        history = self.brain.get_team_chat()
-        if history:
-            html = ""
-            for h in history:
-                color = "#5865F2" if "HOST" in h['user'] else "#F59E0B"
-                html += f"""
-                <div style="margin-bottom: 15px; padding: 10px; background-color: #0f0f0f; border-radius: 8px; border: 1px solid #222;">
-                    <div style="color:{color}; font-size: 10px; font-weight: bold; margin-bottom: 5px;">👤 {h['user']}</div>
-                    <div style="background-color: #1a1a1a; padding: 8px; border-radius: 6px; margin-bottom: 5px; border-left: 2px solid {color};">
-                        <span style="color: #ccc; font-weight: bold;">Q:</span> <span style="color: #fff; white-space: pre-wrap;">{h['query']}</span>
-                    </div>
-                    <div style="background-color: #111; padding: 8px; border-radius: 6px; color: #aaa; font-size: 12px; white-space: pre-wrap;">
-                        <span style="color: #5865F2; font-weight: bold;">AI:</span> {h['answer']}
-                    </div>
-                </div>
-                """
-            if self.team_view.toHtml() != html:
-                sb = self.team_view.verticalScrollBar()
-                was_at_bottom = sb.value() >= (sb.maximum() - 20)
-                old_val = sb.value()
-                self.team_view.setHtml(html)
-                if was_at_bottom: sb.setValue(sb.maximum())
-                else: sb.setValue(old_val)
-        
-        if hasattr(self.brain, 'get_connected_users'):
-            users = self.brain.get_connected_users()
-            self.user_list.clear(); self.user_list.addItem("👤 Host (Admin)")
-            for u in users: self.user_list.addItem(f"🟠 {u['email']}" if u['role']=='collaborator' else f"⚪ {u['email']}")
+    def start_team_feed(self):
+        """(Re)subscribes the Team Stream and user list to the current brain's server"""
+        if self.team_feed:
+            self.team_feed.stop(); self.team_feed.entries_signal.disconnect(); self.team_feed.presence_signal.disconnect(); self.team_feed.reset_signal.disconnect()
+            self.old_feeds = [f for f in self.old_feeds if f.isRunning()] + [self.team_feed]   # let blocked reads finish
+        self.team_view.clear(); self.team_last_id = 0; self.show_users([])
+        self.team_feed = TeamFeed(self.brain)
+        self.team_feed.entries_signal.connect(self.add_team_entries); self.team_feed.presence_signal.connect(self.show_users)
+        self.team_feed.reset_signal.connect(self.reset_team_view)
+        self.team_feed.start()
+
+    def reset_team_view(self):
+        self.team_view.clear(); self.team_last_id = 0
+
+    def add_team_entries(self, last_id, html):
+        """Appends pre-rendered entries; anything at or below the last id shown is a stale replay"""
+        if last_id <= self.team_last_id: return
+        self.team_last_id = last_id
+        sb = self.team_view.verticalScrollBar()
+        was_at_bottom = sb.value() >= (sb.maximum() - 20)
+        cursor = QTextCursor(self.team_view.document()); cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertHtml(html); cursor.insertBlock()
+        if was_at_bottom: sb.setValue(sb.maximum())
+
+    def show_users(self, users):
+        self.user_list.clear(); self.user_list.addItem("👤 Host (Admin)")
+        for u in users: self.user_list.addItem(f"🟠 {u['email']}" if u['role']=='collaborator' else f"⚪ {u['email']}")
 
     def ask_text(self):
         t = self.inp.text().strip(); 
@@ -272,9 +319,27 @@ class CoreApp(QMainWindow):
 
         self.worker = TaskWorker(self.brain, "query", text, public_flag=is_public, history=formatted_history)
         self.worker.result_signal.connect(lambda r: self.finish_query(r, is_public))
+        self.stream_pos = None
+        if not is_public: self.worker.token_signal.connect(self.stream_token)
         self.worker.start()
 
+    def stream_token(self, tok):
+        # Partial answer is shown as plain text in a trailing block, replaced by the rendered bubble at the end
+        cur = QTextCursor(self.chat.document())
+        if self.stream_pos is None:
+            self.set_status("✍️ Answering...")
+            self.chat.append(""); self.stream_pos = self.chat.document().lastBlock().position()
+        cur.movePosition(QTextCursor.MoveOperation.End); cur.insertText(tok)
+        sb = self.chat.verticalScrollBar(); sb.setValue(sb.maximum())
+
+    def clear_stream(self):
+        if self.stream_pos is None: return
+        cur = QTextCursor(self.chat.document()); cur.setPosition(max(self.stream_pos - 1, 0))
+        cur.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor); cur.removeSelectedText()
+        self.stream_pos = None
+
     def finish_query(self, result, is_public):
+        self.clear_stream()
         if isinstance(result, str):
             ans = result; srcs = []
         elif isinstance(result, tuple) and len(result) == 2:
@@ -311,7 +376,7 @@ class CoreApp(QMainWindow):
             if not isinstance(self.brain, RemoteBrain): self.btn_save_brain.setEnabled(True)
         else: self.add_msg(f"❌ {res}", "ai"); self.set_status("Error")
 
-    def do_sync(self): self.set_status("Syncing..."); self.worker = TaskWorker(self.brain, "sync_server"); self.worker.result_signal.connect(self.finish_sync); self.worker.start()
+    def do_sync(self): self.set_status("Syncing..."); self.worker = TaskWorker(self.brain, "sync_server"); self.worker.msg_signal.connect(self.set_status); self.worker.result_signal.connect(self.finish_sync); self.worker.start()
     def finish_sync(self, res): 
         if "SUCCESS" in res: self.set_status("Synced"); QMessageBox.information(self, "Sync", "✅ Server Updated.")
         else: self.set_status("Error"); QMessageBox.warning(self, "Sync Error", res)
@@ -336,7 +401,7 @@ class CoreApp(QMainWindow):
             url, ok1 = QInputDialog.getText(self, "Join Team", "Host URL:"); token, ok2 = QInputDialog.getText(self, "Auth", "Token:")
             if ok1 and ok2:
                 try:
-                    role_data = requests.get(f"{url}/check_role", headers={"x-access-token": token}, timeout=5).json()
+                    role_data = client(url, token).get("/check_role").json()
                     self.brain = RemoteBrain(url, token); role = role_data['role']
                     
                     # --- COLLABORATOR UI LOCKS ---
@@ -357,11 +422,11 @@ class CoreApp(QMainWindow):
                     else: 
                         self.user_badge.setText(" Remote (Guest) "); self.user_badge.setStyleSheet(f"background-color: {STATUS_GUEST}; color: white; border-radius: 4px; padding: 5px; font-weight:bold;"); self.btn_new.setEnabled(False) 
                     self.btn_join.setText("❌ Leave Team"); self.btn_invite.setEnabled(False); self.btn_sync.setEnabled(False)
-                    self.unlock_ui(); self.add_msg(f"Connected as {role.title()}.", "ai")
+                    self.unlock_ui(); self.add_msg(f"Connected as {role.title()}.", "ai"); self.start_team_feed()
                 except Exception as e: self.add_msg(f"❌ Connection Failed: {e}", "ai"); self.btn_join.setChecked(False)
             else: self.btn_join.setChecked(False)
         else:
-            try: requests.post(f"{self.brain.url}/logout", headers={"x-access-token": self.brain.token}, timeout=2)
+            try: self.brain.api.post("/logout")
             except: pass
             
             # --- RESTORE HOST UI ---
@@ -375,12 +440,14 @@ class CoreApp(QMainWindow):
             self.btn_load_brain.setEnabled(True)
 
             self.btn_join.setText("🌐 Join Team"); self.btn_invite.setEnabled(True); self.btn_sync.setEnabled(True); self.btn_new.setEnabled(True); self.lock_ui() 
+            self.start_team_feed()
 
     def closeEvent(self, event):
         if hasattr(self, 'brain') and isinstance(self.brain, RemoteBrain):
-            try: requests.post(f"{self.brain.url}/logout", headers={"x-access-token": self.brain.token}, timeout=1)
+            try: self.brain.api.post("/logout", timeout=1)
             except: pass
         if self.voice_thread: self.voice_thread.stop()
+        if self.team_feed: self.team_feed.stop()
         event.accept()
 
     def add_msg(self, text, type="user", srcs=None):
@@ -0,0 +1,134 @@
+import os
+import re
+import queue
+import threading
+import collections
+import concurrent.futures
+
+SKIP_DIRS = {'.git', '.hg', '.svn', 'node_modules', 'venv', '.venv', 'env', '__pycache__', '.mypy_cache',
+             '.pytest_cache', '.tox', '.idea', '.vscode', 'build', 'dist', 'target'}
+MAX_FILE_BYTES = 2 * 1024 * 1024    # bigger files are generated code, dumps or data, not worth embedding
+BINARY_SNIFF = 8192
+
+
+def is_binary(raw):
+    """Git's heuristic: a NUL byte near the start means binary"""
+    return b"\0" in raw[:BINARY_SNIFF]
+
+
+def _ext(name):
+    i = name.rfind(".")
+    return name[i:] if i > 0 else ""     # same as os.path.splitext for a bare name, minus the overhead
+
+
+def _glob_regex(pat):
+    out, i = [], 0
+    while i < len(pat):
+        c = pat[i]
+        if pat.startswith("**/", i): out.append("(?:.*/)?"); i += 3; continue
+        if pat.startswith("**", i): out.append(".*"); i += 2; continue
+        if c == "*": out.append("[^/]*")
+        elif c == "?": out.append("[^/]")
+        elif c == "[" and "]" in pat[i + 1:]:
+            j = pat.index("]", i + 1)
+            body = pat[i + 1:j]
+            if body.startswith("!"): body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]"); i = j + 1; continue
+        elif c == "\\" and i + 1 < len(pat): out.append(re.escape(pat[i + 1])); i += 2; continue
+        else: out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def _compile_rule(line):
+    """(regex, negate, dir_only) for one .gitignore line, or None for blanks/comments"""
+    line = line.rstrip("\r\n")
+    if not line.strip() or line.startswith("#"): return None
+    if not line.endswith("\\ "): line = line.rstrip()
+    negate = line.startswith("!")
+    if negate: line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line: return None
+    anchored = "/" in line           # a slash anywhere but the end ties the pattern to this directory
+    line = line.lstrip("/")
+    return re.compile(("" if anchored else "(?:.*/)?") + _glob_regex(line) + "$"), negate, dir_only
+
+
+def load_gitignore(dir_path):
+    """(dir_path + separator, rules) for the .gitignore in dir_path, or None"""
+    try:
+        with open(os.path.join(dir_path, ".gitignore"), encoding="utf-8", errors="ignore") as f:
+            rules = [r for r in map(_compile_rule, f) if r]
+    except OSError: return None
+    return (os.path.join(dir_path, ""), rules) if rules else None
+
+
+def is_ignored(ignores, path, is_dir):
+    """Applies every .gitignore from the root down; like git, the last matching rule wins"""
+    hit = False
+    for prefix, rules in ignores:
+        rel = path[len(prefix):]
+        if os.sep != "/": rel = rel.replace(os.sep, "/")
+        for rx, negate, dir_only in rules:
+            if dir_only and not is_dir: continue
+            if rx.match(rel): hit = not negate
+    return hit
+
+
+def scan_files(root, extensions, skip_dirs=SKIP_DIRS, max_bytes=MAX_FILE_BYTES, gitignore=True, workers=8):
+    """
+    Yields paths of files under `root` whose extension is in `extensions`, as they are found.
+    Directories are listed in parallel with os.scandir; `skip_dirs` (exact names) and
+    .gitignore'd directories are pruned before they are entered, and files over `max_bytes`
+    are left out. Order is not deterministic.
+    """
+    found = queue.Queue()
+    done = object()
+    stop = threading.Event()
+    pending = [1]
+    lock = threading.Lock()
+    ex = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def visit(dir_path, ignores):
+        try:
+            if stop.is_set(): return
+            try:
+                with os.scandir(dir_path) as it: entries = list(it)
+            except OSError: entries = []
+            if gitignore and any(e.name == ".gitignore" for e in entries):
+                rules = load_gitignore(dir_path)
+                if rules: ignores = ignores + [rules]
+            files = []
+            for e in entries:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if e.name in skip_dirs or (ignores and is_ignored(ignores, e.path, True)): continue
+                        with lock: pending[0] += 1
+                        ex.submit(visit, e.path, ignores)
+                    elif _ext(e.name) in extensions and e.is_file():
+                        if ignores and is_ignored(ignores, e.path, False): continue
+                        if e.stat().st_size <= max_bytes: files.append(e.path)
+                except OSError: continue
+            if files: found.put(files)   # one queue hop per directory, not per file
+        finally:
+            with lock:
+                pending[0] -= 1
+                if pending[0] == 0: found.put(done)
+
+    ex.submit(visit, root, [])
+    try:
+        while (files := found.get()) is not done: yield from files
+    finally:
+        stop.set()
+        ex.shutdown(wait=False, cancel_futures=True)
+
+
+def map_bounded(fn, items, workers=None, inflight=256):
+    """Like Executor.map over a lazy iterable, but never more than `inflight` results pending"""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+        pending = collections.deque()
+        for item in items:
+            pending.append(ex.submit(fn, item))
+            if len(pending) >= inflight: yield pending.popleft().result()
+        while pending: yield pending.popleft().result()
@@ -1,22 +1,124 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException, Header, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Header, Depends, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from backend import CoreBrain
+from snapshot import file_sha256
+import gzip
 import secrets
+import numpy as np
 import os
 import base64
+import re
+import json
+import hashlib
+import asyncio
+import contextlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-app = FastAPI(title="CodeChat Team Server")
+class ActivityLog:
+    """
+    Fixed-size ring buffer of Team Stream entries. Ids go up by one per entry, so entry i lives
+    in slot (i - 1) % size and since()/tail() cost O(entries returned), not O(history).
+    """
+    def __init__(self, size):
+        self.size = size; self.slots = [None] * size; self.last_id = 0
+
+    @property
+    def first_id(self): return max(1, self.last_id - self.size + 1)
+
+    def append(self, entry):
+        self.last_id += 1
+        entry = {"id": self.last_id, **entry}
+        self.slots[(self.last_id - 1) % self.size] = entry
+        return entry
+
+    def since(self, after=0, limit=None):
+        """Entries with id > after, oldest first, at most `limit` of them"""
+        start = max(after + 1, self.first_id)
+        end = self.last_id if limit is None else min(self.last_id, start + limit - 1)
+        return [self.slots[(i - 1) % self.size] for i in range(start, end + 1)]
+
+    def tail(self, n): return self.since(self.last_id - n)
+
+class GzipRequest(Request):
+    """Inflates request bodies the client sent with Content-Encoding: gzip"""
+    async def body(self):
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if "gzip" in self.headers.get("content-encoding", ""): body = gzip.decompress(body)
+            self._body = body
+        return self._body
+
+class GzipRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        async def gzip_handler(request: Request): return await handler(GzipRequest(request.scope, request.receive))
+        return gzip_handler
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    presence = asyncio.create_task(presence_loop())
+    try: yield
+    finally:
+        presence.cancel()
+        if dirty_since is not None: brain.save_snapshot("server_brain.brain")   # flush changes still waiting for save_later
+
+app = FastAPI(title="CodeChat Team Server", lifespan=lifespan)
+app.router.route_class = GzipRoute
+app.add_middleware(GZipMiddleware, minimum_size=1024)   # skips text/event-stream, so /query_stream still streams
 brain = CoreBrain()
 
 ACCESS_TOKENS = {} 
 USER_SESSIONS = {} 
-TEAM_HISTORY = []  
+TEAM_HISTORY_SIZE = int(os.environ.get("CODECHAT_TEAM_HISTORY", 5000))   # entries kept for /team_activity and replays
+TEAM_PAGE_MAX = 1000
+TEAM_LOG = ActivityLog(TEAM_HISTORY_SIZE)
+BOOT_ID = secrets.token_hex(8)   # TEAM_LOG ids restart with the server; clients compare this to notice
 ACTIVE_USERS = {} 
 
+# /team_stream pushes new TEAM_LOG entries and presence changes instead of clients polling.
+# Entries carry an increasing id; reconnecting clients pass the last one back as their cursor.
+SUBSCRIBERS = set()      # one asyncio.Queue of pending SSE messages per open stream
+PRESENCE = []            # user list last pushed to subscribers
+STREAM_PING = 15.0       # keep-alive comment interval; also keeps streaming users marked active
+STREAM_BACKLOG = 1000    # a subscriber this far behind is dropped and has to reconnect
+STREAM_REPLAY = 200      # most entries replayed to a (re)connecting stream
+
+# Endpoints are async so light calls (/team_activity, /active_users, ...) are answered on the
+# event loop while heavy work runs in pools. Brain consistency is handled by brain.lock.
+LLM_WORKERS = 2    # questions answered in parallel (each one holds an Ollama generation)
+LLM_QUEUE = 16     # questions allowed to wait for a worker before we answer 503
+llm_pool = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="brain-io")  # sync/save, one at a time
+INGEST_WORKERS = 2  # uploads split + embedded side by side; rows are appended under brain.lock
+ingest_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+LLM_PENDING = 0
+
+# Host -> server brain uploads: {upload_id: {size, chunk_size, n_chunks, received}}.
+# The upload id is the snapshot's sha256, so restarting a sync of the same brain resumes it.
+SYNC_DIR = "sync_uploads"
+SYNC_MAX_CHUNK = 64 * 1024 * 1024
+SYNC_MAX_BYTES = int(os.environ.get("CODECHAT_MAX_SYNC_BYTES", 8 * 1024 ** 3))   # start pre-allocates this much disk
+UPLOADS = {}
+
+# /ingest batch_id -> its indexing task, so a client retrying a timed-out upload does not store it twice
+INGEST_JOBS = OrderedDict()
+INGEST_JOBS_MAX = 1024
+
+# Uploads only mark the brain dirty; it is written SAVE_DELAY seconds after the last change,
+# but never later than SAVE_MAX_DELAY after the first unsaved one.
+SAVE_DELAY = 5.0
+SAVE_MAX_DELAY = 60.0
+save_task = None
+dirty_since = None
+
 class Query(BaseModel): 
     text: str
     public: bool = False 
@@ -26,36 +128,214 @@ class FileChunk(BaseModel): text: str; source: str
 class IngestRequest(BaseModel): 
     chunks: List[FileChunk]
     append_mode: bool = True 
+    batch_id: str = ""
 
 class SyncPayload(BaseModel): b64_data: str 
+class SyncStart(BaseModel): size: int; sha256: str; chunk_size: int
+class SyncDelta(BaseModel):
+    base_version: str
+    removed: List[int] = []
+    chunks: List[FileChunk] = []
+    vectors_b64: str = ""
+    symbols: Dict[str, List[list]] = {}
 class HostLog(BaseModel): query: str; answer: str 
 
-def get_user(x_access_token: str = Header(...)):
+async def get_user(x_access_token: str = Header(...)):
     if x_access_token not in ACCESS_TOKENS:
         raise HTTPException(status_code=401, detail="Invalid Token")
-    ACTIVE_USERS[x_access_token] = datetime.now()
+    touch_user(x_access_token)
     return {"token": x_access_token, "info": ACCESS_TOKENS[x_access_token]}
 
+async def host_only(request: Request):
+    """Brain uploads replace what every user queries, so only the Host's own machine may send them"""
+    if request.client is None or request.client.host not in ("127.0.0.1", "::1", "::ffff:127.0.0.1"):
+        raise HTTPException(status_code=403, detail="Only the Host can sync the brain")
+
+def claim_llm_slot():
+    global LLM_PENDING
+    if LLM_PENDING >= LLM_WORKERS + LLM_QUEUE:
+        raise HTTPException(status_code=503, detail="Server is busy answering other questions. Try again shortly.")
+    LLM_PENDING += 1
+
+def release_llm_slot():
+    global LLM_PENDING
+    LLM_PENDING -= 1
+
+async def run_in(pool, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+async def relay(gen_fn, pool, idle=None):
+    """Runs a blocking generator on `pool` and yields its items on the event loop, plus None every `idle` seconds without one"""
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+    def pump():
+        try:
+            for item in gen_fn():
+                if stop.is_set(): break   # client went away, free the worker
+                loop.call_soon_threadsafe(q.put_nowait, item)
+        finally: loop.call_soon_threadsafe(q.put_nowait, done)
+    fut = loop.run_in_executor(pool, pump)
+    try:
+        while True:
+            try: item = await asyncio.wait_for(q.get(), idle)
+            except asyncio.TimeoutError: yield None; continue
+            if item is done: break
+            yield item
+        await fut
+    finally: stop.set()
+
+def schedule_save():
+    global save_task, dirty_since
+    loop = asyncio.get_running_loop()
+    if dirty_since is None: dirty_since = loop.time()
+    if save_task is not None: save_task.cancel()
+    save_task = asyncio.create_task(save_later(max(0.0, min(SAVE_DELAY, dirty_since + SAVE_MAX_DELAY - loop.time()))))
+
+async def save_later(delay):
+    global save_task, dirty_since
+    await asyncio.sleep(delay)
+    save_task = dirty_since = None   # changes from here on schedule a new save
+    res = await run_in(io_pool, brain.save_snapshot, "server_brain.brain")
+    print(f"💾 Brain saved: {res}")
+
+def sse(event, data, event_id=None):
+    return f"event: {event}\n" + (f"id: {event_id}\n" if event_id is not None else "") + f"data: {json.dumps(data)}\n\n"
+
+def publish(msg):
+    for q in list(SUBSCRIBERS):
+        if q.qsize() >= STREAM_BACKLOG: SUBSCRIBERS.discard(q)
+        else: q.put_nowait(msg)
+
+def current_users():
+    now = datetime.now()
+    for t in [t for t, seen in ACTIVE_USERS.items() if (now - seen).total_seconds() > 60]: del ACTIVE_USERS[t]
+    users = []
+    for token in ACTIVE_USERS:
+        info = ACCESS_TOKENS.get(token, {"email": "Unknown", "role": "Unknown"})
+        users.append({"email": info['email'], "role": info['role']})
+    return users
+
+def touch_user(token):
+    is_new = token not in ACTIVE_USERS
+    ACTIVE_USERS[token] = datetime.now()
+    if is_new: refresh_presence()
+
+def refresh_presence():
+    global PRESENCE
+    users = current_users()
+    if users != PRESENCE:
+        PRESENCE = users
+        publish(sse("presence", {"users": users}))
+
+async def presence_loop():
+    while True:
+        await asyncio.sleep(10)
+        refresh_presence()   # notices users whose last request is older than 60 s
+
+def log_team(user, query, answer):
+    entry = TEAM_LOG.append({"user": user, "query": query, "answer": answer})
+    publish(sse("activity", entry, entry['id']))
+
 @app.post("/generate_invite")
-def create_invite(inv: Invite):
+async def create_invite(inv: Invite):
     token = secrets.token_hex(16)
     ACCESS_TOKENS[token] = {"email": inv.email, "role": inv.role}
     USER_SESSIONS[token] = [] 
     return {"status": "Invite generated", "token": token}
 
 @app.post("/logout")
-def logout_user(x_access_token: str = Header(...)):
+async def logout_user(x_access_token: str = Header(...)):
     if x_access_token in ACTIVE_USERS:
         del ACTIVE_USERS[x_access_token]
+        refresh_presence()
     return {"status": "Logged out"}
 
-@app.post("/sync_brain")
-def sync_brain(payload: SyncPayload):
+def write_synced_brain(b64_data):
+    with open("server_brain.brain.tmp", "wb") as f: f.write(base64.b64decode(b64_data))
+    return brain.replace_snapshot("server_brain.brain.tmp", "server_brain.brain")
+
+def upload_path(upload_id): return os.path.join(SYNC_DIR, f"{upload_id}.part")
+
+def drop_upload(upload_id):
+    UPLOADS.pop(upload_id, None)
+    try: os.remove(upload_path(upload_id))
+    except OSError: pass
+
+def write_upload_chunk(upload_id, offset, data, digest):
+    if hashlib.sha256(data).hexdigest() != digest: return False
+    with open(upload_path(upload_id), "r+b") as f: f.seek(offset); f.write(data)
+    return True
+
+def finish_upload(upload_id):
+    path = upload_path(upload_id)
+    if file_sha256(path) != upload_id: drop_upload(upload_id); return "Checksum mismatch, upload discarded"
+    UPLOADS.pop(upload_id, None)
+    return brain.replace_snapshot(path, "server_brain.brain")
+
+@app.post("/sync_brain/start", dependencies=[Depends(host_only)])
+async def sync_start(req: SyncStart):
+    upload_id = req.sha256.lower()
+    if not re.fullmatch(r"[0-9a-f]{64}", upload_id) or req.size <= 0 or not 0 < req.chunk_size <= SYNC_MAX_CHUNK:
+        raise HTTPException(status_code=400, detail="Bad upload header")
+    if req.size > SYNC_MAX_BYTES: raise HTTPException(status_code=413, detail=f"Brain is larger than the {SYNC_MAX_BYTES} byte sync limit")
+    up = UPLOADS.get(upload_id)
+    if up is None or up['size'] != req.size or up['chunk_size'] != req.chunk_size:
+        for old in list(UPLOADS): drop_upload(old)   # only the latest Host brain is worth keeping
+        os.makedirs(SYNC_DIR, exist_ok=True)
+        with open(upload_path(upload_id), "wb") as f: f.truncate(req.size)
+        up = UPLOADS[upload_id] = {"size": req.size, "chunk_size": req.chunk_size,
+                                   "n_chunks": -(-req.size // req.chunk_size), "received": set()}
+    missing = [i for i in range(up['n_chunks']) if i not in up['received']]
+    return {"upload_id": upload_id, "chunk_size": up['chunk_size'], "missing": missing}
+
+@app.put("/sync_brain/{upload_id}/{index}", dependencies=[Depends(host_only)])
+async def sync_chunk(upload_id: str, index: int, request: Request, x_chunk_sha256: str = Header(...)):
+    up = UPLOADS.get(upload_id)
+    if up is None: raise HTTPException(status_code=404, detail="Unknown upload")
+    if not 0 <= index < up['n_chunks']: raise HTTPException(status_code=400, detail="Chunk out of range")
+    offset = index * up['chunk_size']
+    data = await request.body()
+    if len(data) != min(up['chunk_size'], up['size'] - offset): raise HTTPException(status_code=400, detail="Wrong chunk length")
+    if not await run_in(None, write_upload_chunk, upload_id, offset, data, x_chunk_sha256.lower()):
+        raise HTTPException(status_code=422, detail="Chunk checksum mismatch")
+    up['received'].add(index)
+    return {"status": "ok"}
+
+@app.post("/sync_brain/{upload_id}/finish", dependencies=[Depends(host_only)])
+async def sync_finish(upload_id: str):
+    up = UPLOADS.get(upload_id)
+    if up is None: raise HTTPException(status_code=404, detail="Unknown upload")
+    if len(up['received']) < up['n_chunks']: raise HTTPException(status_code=409, detail="Upload incomplete")
+    print("⚡ HOST SYNC REQUEST RECEIVED")
+    res = await run_in(io_pool, finish_upload, upload_id)
+    if "Success" not in res:
+        print(f"❌ SYNC ERROR: {res}")
+        raise HTTPException(status_code=500, detail=f"Failed to load: {res}")
+    print(f"✅ BRAIN SYNCED: {len(brain.chunks)} chunks.")
+    return {"status": "Server Brain Synced", "chunks": len(brain.chunks), "version": brain.version}
+
+# Host sends only the rows added/removed since its last sync; 409 tells it to fall back to a full upload
+def apply_sync_delta(d):
+    vecs = np.frombuffer(base64.b64decode(d.vectors_b64), dtype=np.float32)
+    return brain.apply_delta(d.base_version, d.removed, [(c.text, c.source) for c in d.chunks], vecs, lambda x: print(f"-> {x}"), d.symbols)
+
+@app.post("/sync_brain/delta", dependencies=[Depends(host_only)])
+async def sync_delta(d: SyncDelta):
+    try: version = await run_in(io_pool, apply_sync_delta, d)
+    except Exception as e: raise HTTPException(status_code=500, detail=f"Sync Error: {str(e)}")
+    if version is None: raise HTTPException(status_code=409, detail="Server brain changed since the last sync")
+    schedule_save()
+    print(f"✅ DELTA SYNCED: +{len(d.chunks)} / -{len(d.removed)} chunks.")
+    return {"status": "Server Brain Synced", "chunks": brain.embeddings.live, "version": version}
+
+# Older Host builds still post the whole brain as one base64 JSON string
+@app.post("/sync_brain", dependencies=[Depends(host_only)])
+async def sync_brain(payload: SyncPayload):
     print("⚡ HOST SYNC REQUEST RECEIVED")
     try:
-        file_bytes = base64.b64decode(payload.b64_data)
-        with open("server_brain.brain", "wb") as f: f.write(file_bytes)
-        res = brain.load_snapshot("server_brain.brain")
+        res = await run_in(io_pool, write_synced_brain, payload.b64_data)
         if "Success" in res:
             print(f"✅ BRAIN SYNCED: {len(brain.chunks)} chunks.")
             return {"status": "Server Brain Synced", "chunks": len(brain.chunks)}
@@ -67,68 +347,133 @@ def sync_brain(payload: SyncPayload):
 
 # --- NEW: Allow Collaborators to Download Brain for 'Save Session' ---
 @app.get("/download_brain")
-def download_brain(user_data: dict = Depends(get_user)):
+async def download_brain(user_data: dict = Depends(get_user)):
     # Create a fresh snapshot on server
-    res = brain.save_snapshot("server_download.brain")
+    res = await run_in(io_pool, brain.save_snapshot, "server_download.brain")
     if "Success" in res and os.path.exists("server_download.brain"):
         return FileResponse("server_download.brain", filename="codechat_brain.brain")
     raise HTTPException(status_code=500, detail="Could not generate brain snapshot")
 
 @app.post("/query")
-def query_brain(q: Query, user_data: dict = Depends(get_user)):
+async def query_brain(q: Query, user_data: dict = Depends(get_user)):
     token = user_data['token']
     email = user_data['info']['email']
     if len(brain.chunks) == 0:
         return {"answer": "⚠️ Server Brain is empty. Ask the Host to load code.", "sources": []}
-    ans, srcs = brain.ask_question(q.text, history=USER_SESSIONS[token])
-    if q.public:
-        TEAM_HISTORY.append({"user": email, "query": q.text, "answer": ans})
-        if len(TEAM_HISTORY) > 50: TEAM_HISTORY.pop(0) 
+    # retrieval, symbol-table and cached answers run first: only a real generation takes an LLM slot
+    plan = await run_in(None, brain.prepare_answer, q.text, USER_SESSIONS[token])
+    generate = 'messages' in plan
+    if generate: claim_llm_slot()
+    try: ans, srcs = await run_in(llm_pool if generate else None, brain.ask_question, q.text, USER_SESSIONS[token], False, plan)
+    finally:
+        if generate: release_llm_slot()
+    if q.public: log_team(email, q.text, ans)
     return {"answer": ans, "sources": srcs}
 
+# --- Server-Sent Events variant of /query: tokens are pushed as Ollama generates them ---
+@app.post("/query_stream")
+async def query_brain_stream(q: Query, user_data: dict = Depends(get_user)):
+    token = user_data['token']
+    email = user_data['info']['email']
+    if len(brain.chunks) == 0:
+        msg = json.dumps({'token': '⚠️ Server Brain is empty. Ask the Host to load code.'})
+        return StreamingResponse(iter([f"data: {msg}\n\n"]), media_type="text/event-stream")
+    plan = await run_in(None, brain.prepare_answer, q.text, USER_SESSIONS[token])
+    generate = 'messages' in plan
+    if generate: claim_llm_slot()
+    async def events():
+        try:
+            ans = ""
+            # sent at once and then every STREAM_PING while the question waits for an LLM worker or its
+            # first token, so the client's read timeout only fires if the server is really gone
+            yield ": queued\n\n"
+            async for ev in relay(lambda: brain.ask_question_stream(q.text, USER_SESSIONS[token], False, plan), llm_pool if generate else None, STREAM_PING):
+                if ev is None: yield ": ping\n\n"; continue
+                if 'token' in ev: ans += ev['token']
+                if 'error' in ev: ans = ev['error']
+                yield f"data: {json.dumps(ev)}\n\n"
+            if q.public: log_team(email, q.text, ans)
+        finally:
+            if generate: release_llm_slot()
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/ingest")
-def ingest_remote(req: IngestRequest, user_data: dict = Depends(get_user)):
+async def ingest_remote(req: IngestRequest, user_data: dict = Depends(get_user)):
     print(f"📥 UPLOAD REQUEST from {user_data['info']['email']} | Mode: {'Append' if req.append_mode else 'Single'}")
     if user_data['info']['role'] != "collaborator":
         raise HTTPException(status_code=403, detail="Guests cannot upload code.")
-    try:
+    key = (user_data['token'], req.batch_id)
+    job = INGEST_JOBS.get(key) if req.batch_id else None
+    if job is None:
         tuples = [(c.text, c.source) for c in req.chunks]
-        brain.ingest_remote_data(tuples, lambda x: print(f"-> {x}"), append_mode=req.append_mode)
-        brain.save_snapshot("server_brain.brain")
+        job = asyncio.ensure_future(run_in(ingest_pool, brain.ingest_remote_data, tuples, lambda x: print(f"-> {x}"), req.append_mode))
+        if req.batch_id:
+            INGEST_JOBS[key] = job
+            while len(INGEST_JOBS) > INGEST_JOBS_MAX: INGEST_JOBS.popitem(last=False)
+    else: print("↩️ Retried batch, not indexing it again")
+    try:
+        await asyncio.shield(job)   # a dropped connection must not abandon the batch half-way
+        schedule_save()
         return {"status": "Indexed"}
     except Exception as e:
+        if INGEST_JOBS.get(key) is job: del INGEST_JOBS[key]   # failed: let a retry run it again
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/host_log")
-def log_host_activity(log: HostLog):
-    TEAM_HISTORY.append({"user": "HOST (Admin)", "query": log.query, "answer": log.answer})
-    if len(TEAM_HISTORY) > 50: TEAM_HISTORY.pop(0)
+async def log_host_activity(log: HostLog):
+    log_team("HOST (Admin)", log.query, log.answer)
     return {"status": "logged"}
 
 @app.get("/check_role")
-def check_role(user_data: dict = Depends(get_user)):
+async def check_role(user_data: dict = Depends(get_user)):
     return {"role": user_data['info']['role']}
 
 @app.get("/team_activity")
-def get_team_activity(x_access_token: Optional[str] = Header(None)):
+async def get_team_activity(since: Optional[int] = None, limit: int = 50, x_access_token: Optional[str] = Header(None)):
+    """Without `since`: the latest `limit` entries. With it: up to `limit` entries after that id, oldest first."""
     if x_access_token and x_access_token in ACCESS_TOKENS:
-        ACTIVE_USERS[x_access_token] = datetime.now()
-    return {"history": TEAM_HISTORY}
+        touch_user(x_access_token)
+    limit = max(1, min(limit, TEAM_PAGE_MAX))
+    history = TEAM_LOG.tail(limit) if since is None else TEAM_LOG.since(since, limit)
+    return {"history": history, "last_id": TEAM_LOG.last_id}
+
+@app.get("/symbols")
+async def find_symbol(name: str, limit: int = 50, user_data: dict = Depends(get_user)):
+    return {"symbols": await run_in(None, brain.find_symbol, name, max(1, min(limit, 500)))}
+
+@app.get("/cache_stats")
+async def cache_stats():
+    return {"answers": brain.answer_cache.stats(), "query_embeddings": brain.query_embedder.stats()}
 
 @app.get("/active_users")
-def get_active_users():
-    now = datetime.now()
-    active_list = []
-    to_remove = []
-    for token, last_seen in ACTIVE_USERS.items():
-        if (now - last_seen).total_seconds() > 60: 
-            to_remove.append(token)
-        else:
-            info = ACCESS_TOKENS.get(token, {"email": "Unknown", "role": "Unknown"})
-            active_list.append({"email": info['email'], "role": info['role']})
-    for t in to_remove:
-        del ACTIVE_USERS[t]
-    return {"users": active_list}
+async def get_active_users():
+    return {"users": current_users()}
+
+@app.get("/team_stream")
+async def team_stream(since: int = 0, epoch: str = "", last_event_id: Optional[str] = Header(None), x_access_token: Optional[str] = Header(None)):
+    """
+    SSE feed: an `epoch` event naming this server run, a replay of the entries after `since`
+    (or Last-Event-ID), then new entries and presence changes as they happen
+    """
+    if last_event_id and last_event_id.isdigit(): since = max(since, int(last_event_id))
+    if since > TEAM_LOG.last_id or (epoch and epoch != BOOT_ID): since = 0   # cursor from before a server restart
+    token = x_access_token if x_access_token in ACCESS_TOKENS else None
+    if token: touch_user(token)
+    q = asyncio.Queue()
+    SUBSCRIBERS.add(q)
+    backlog = TEAM_LOG.since(max(since, TEAM_LOG.last_id - STREAM_REPLAY))   # taken with the subscription, so nothing is missed or doubled
+    async def events():
+        try:
+            yield sse("epoch", {"epoch": BOOT_ID})
+            for h in backlog: yield sse("activity", h, h['id'])
+            yield sse("presence", {"users": current_users()})
+            while q in SUBSCRIBERS:
+                try: yield await asyncio.wait_for(q.get(), STREAM_PING)
+                except asyncio.TimeoutError:
+                    if token: touch_user(token)
+                    yield ": ping\n\n"
+        finally: SUBSCRIBERS.discard(q)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 if __name__ == "__main__":
     print("\n" + "="*50)
@@ -0,0 +1,63 @@
+import json
+import hashlib
+import numpy as np
+
+# .brain layout:
+#   8 bytes  magic
+#   8 bytes  little-endian header length
+#   header   JSON table of contents {name: {offset, dtype, shape}}
+#   sections raw array bytes, each 64-byte aligned, offsets relative to the first section
+# Sections are stored uncompressed so they can be np.memmap'ed straight out of the file.
+MAGIC = b"CCBRAIN2"
+ALIGN = 64
+
+
+def _align(n): return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def is_snapshot(path):
+    with open(path, 'rb') as f: return f.read(len(MAGIC)) == MAGIC
+
+
+def file_sha256(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for part in iter(lambda: f.read(block), b''): h.update(part)
+    return h.hexdigest()
+
+
+def write_snapshot(path, sections):
+    """Writes a dict of named numpy arrays as one .brain file"""
+    toc = {}
+    pos = 0
+    for name, arr in sections.items():
+        toc[name] = {'offset': pos, 'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+        pos = _align(pos + arr.nbytes)
+    head = json.dumps(toc).encode('utf-8')
+    base = _align(len(MAGIC) + 8 + len(head))
+    with open(path, 'wb') as f:
+        f.write(MAGIC); f.write(np.uint64(len(head)).astype('<u8').tobytes()); f.write(head)
+        for name, arr in sections.items():
+            f.seek(base + toc[name]['offset'])
+            np.ascontiguousarray(arr).tofile(f)
+
+
+def read_snapshot(path, mmap=True):
+    """
+    Returns {name: array}. With mmap=True every non-scalar section is a copy-on-write
+    np.memmap over the file, so nothing is read until it is touched.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC: raise ValueError("Not a CodeChat brain file")
+        hlen = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        toc = json.loads(f.read(hlen).decode('utf-8'))
+    base = _align(len(MAGIC) + 8 + hlen)
+    out = {}
+    for name, e in toc.items():
+        dtype = np.dtype(e['dtype']); shape = tuple(e['shape'])
+        count = int(np.prod(shape))
+        if mmap and shape and count:
+            out[name] = np.memmap(path, dtype=dtype, mode='c', offset=base + e['offset'], shape=shape)
+        else:
+            out[name] = np.fromfile(path, dtype=dtype, count=count, offset=base + e['offset']).reshape(shape)
+    return out
@@ -0,0 +1,161 @@
+import os
+import re
+import ast
+import json
+import numpy as np
+
+_JS = [
+    ('function', r"^[ \t]*(?:export[ \t]+)?(?:default[ \t]+)?(?:async[ \t]+)?function[ \t]*\*?[ \t]*([A-Za-z_$][\w$]*)"),
+    ('class', r"^[ \t]*(?:export[ \t]+)?(?:default[ \t]+)?(?:abstract[ \t]+)?class[ \t]+([A-Za-z_$][\w$]*)"),
+    ('function', r"^[ \t]*(?:export[ \t]+)?(?:const|let|var)[ \t]+([A-Za-z_$][\w$]*)[ \t]*(?::[^=\n]+)?=[ \t]*(?:async[ \t]+)?(?:function\b|\([^)\n]*\)[^=\n]*=>|[A-Za-z_$][\w$]*[ \t]*=>)"),
+    ('type', r"^[ \t]*(?:export[ \t]+)?(?:declare[ \t]+)?(?:interface|type|enum)[ \t]+([A-Za-z_$][\w$]*)"),
+]
+_PATTERNS = {
+    '.js': _JS, '.jsx': _JS, '.ts': _JS, '.tsx': _JS,
+    '.go': [
+        ('function', r"^func[ \t]+(?:\([^)]*\)[ \t]*)?([A-Za-z_]\w*)"),
+        ('type', r"^type[ \t]+([A-Za-z_]\w*)"),
+    ],
+    '.rs': [
+        ('function', r"^[ \t]*(?:pub(?:\([^)]*\))?[ \t]+)?(?:const[ \t]+)?(?:async[ \t]+)?(?:unsafe[ \t]+)?(?:extern[ \t]+\"[^\"]*\"[ \t]+)?fn[ \t]+([A-Za-z_]\w*)"),
+        ('type', r"^[ \t]*(?:pub(?:\([^)]*\))?[ \t]+)?(?:struct|enum|trait|union|type|mod)[ \t]+([A-Za-z_]\w*)"),
+    ],
+    '.java': [
+        ('class', r"^[ \t]*(?:(?:public|private|protected|static|final|abstract|sealed)[ \t]+)*(?:class|interface|enum|record)[ \t]+([A-Za-z_]\w*)"),
+        ('method', r"^[ \t]*(?:(?:public|private|protected|static|final|abstract|synchronized|native|default)[ \t]+)+(?:<[^>\n]*>[ \t]+)?[\w<>\[\]?,. \t]+?[ \t]+([A-Za-z_]\w*)[ \t]*\([^;\n]*$"),
+    ],
+    '.c': [
+        ('function', r"^(?!(?:if|for|while|switch|return|else|do)\b)[A-Za-z_][\w \t\*]*?[ \t\*]([A-Za-z_]\w*)[ \t]*\([^;\n]*\)[ \t]*\{?[ \t]*$"),
+        ('type', r"^[ \t]*(?:typedef[ \t]+)?(?:struct|enum|union)[ \t]+([A-Za-z_]\w*)[ \t]*\{"),
+    ],
+}
+_PATTERNS['.h'] = _PATTERNS['.c']
+_PATTERNS['.cpp'] = _PATTERNS['.hpp'] = _PATTERNS['.cc'] = [
+    ('function', r"^(?!(?:if|for|while|switch|return|else|do)\b)[A-Za-z_][\w \t\*&:<>,]*?[ \t\*&]([A-Za-z_][\w:~]*)[ \t]*\([^;\n]*\)[ \t]*(?:const[ \t]*)?(?:override[ \t]*)?\{?[ \t]*$"),
+    ('class', r"^[ \t]*(?:template[ \t]*<[^>\n]*>[ \t]*)?(?:class|struct)[ \t]+([A-Za-z_]\w*)[^;\n]*$"),
+    ('type', r"^[ \t]*(?:typedef[ \t]+)?(?:enum(?:[ \t]+class)?|union)[ \t]+([A-Za-z_]\w*)"),
+]
+_COMPILED = {ext: [(kind, re.compile(p, re.M)) for kind, p in pats] for ext, pats in _PATTERNS.items()}
+
+_WHERE = re.compile(
+    r"\bwhere\s+(?:is|are)\s+(?:the\s+)?(?:function\s+|class\s+|method\s+|type\s+)?`?([\w.:$]+?)`?(?:\(\))?\s+(?:defined|declared|implemented)\b"
+    r"|\b(?:find|show|locate|go\s+to)\s+(?:me\s+)?(?:the\s+)?(?:definition|declaration)\s+of\s+`?([\w.:$]+?)`?(?:\(\))?[\s?.!]*$", re.I)
+_WORD = re.compile(r"[A-Za-z_$][\w$]*(?:(?:\.|::)[A-Za-z_$][\w$]*)*")
+_LONE_CR = re.compile(r"\r(?!\n)")
+
+
+def normalize_newlines(content):
+    """Turns old Mac CR-only line ends into \n so line numbers agree with ast's; CRLF is left alone"""
+    return _LONE_CR.sub("\n", content) if "\r" in content else content
+
+
+def definition_query(query):
+    """The symbol name in questions like "where is X defined?", else None"""
+    m = _WHERE.search(query)
+    return (m.group(1) or m.group(2)) if m else None
+
+
+def query_words(query): return _WORD.findall(query)
+
+
+def describe(name, hits):
+    """Plain answer text for a definition_query"""
+    lines = [f"`{name}` is defined in {len(hits)} place{'s' if len(hits) > 1 else ''}:"]
+    for h in hits: lines.append(f"- {h['kind']} `{h['name']}` at {h['path']}:{h['line']}\n    {h['definition']}")
+    return "\n".join(lines)
+
+
+def _python_symbols(content, lines):
+    out = []
+    def walk(node, prefix, in_class):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef): kind = 'class'
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)): kind = 'method' if in_class else 'function'
+            else: continue
+            name = prefix + child.name
+            out.append((name, kind, child.lineno, lines[child.lineno - 1].strip()))
+            walk(child, name + ".", kind == 'class')
+    walk(ast.parse(content), "", False)
+    return out
+
+
+def extract_symbols(content, path):
+    """[(name, kind, line, definition line)] for the functions/classes/types defined in one file"""
+    ext = os.path.splitext(path)[1].lower()
+    content = normalize_newlines(content)
+    lines = content.split('\n')
+    if ext == '.py':
+        try: return _python_symbols(content, lines)
+        except (SyntaxError, ValueError, RecursionError, IndexError): return []
+    out = []
+    for kind, rx in _COMPILED.get(ext, ()):
+        for m in rx.finditer(content):
+            line = content.count('\n', 0, m.start(1)) + 1
+            out.append((m.group(1), kind, line, lines[line - 1].strip()))
+    out.sort(key=lambda s: s[2])
+    return out
+
+
+class SymbolIndex:
+    """
+    Definition table built at ingest: source path -> [(name, kind, line, definition line)].
+    Lookups are case-insensitive on the full (dotted) name and on its last part, so both
+    `parse` and `Parser.parse` find a method. Persisted in the snapshot as a JSON section.
+    """
+
+    def __init__(self, files=None):
+        self.files = {}
+        self.by_name = {}      # lowercased name -> {path}
+        for path, syms in (files or {}).items(): self.set_file(path, syms)
+
+    def __len__(self): return sum(len(s) for s in self.files.values())
+
+    @staticmethod
+    def _names(name):
+        low = name.lower()
+        return {low, low.rsplit('.', 1)[-1].rsplit('::', 1)[-1]}
+
+    def set_file(self, path, symbols):
+        self.drop([path])
+        if not symbols: return
+        self.files[path] = [tuple(s) for s in symbols]
+        for s in symbols:
+            for n in self._names(s[0]): self.by_name.setdefault(n, set()).add(path)
+
+    def drop(self, paths):
+        for path in paths:
+            for s in self.files.pop(path, ()):
+                for n in self._names(s[0]):
+                    owners = self.by_name.get(n)
+                    if owners is None: continue
+                    owners.discard(path)
+                    if not owners: del self.by_name[n]
+
+    def keep_only(self, live_paths):
+        self.drop([p for p in self.files if p not in live_paths])
+
+    def lookup(self, name, limit=50):
+        """Definitions named `name` (or ending in `.name`), as dicts with name/kind/path/line/definition"""
+        key = name.strip().lower()
+        hits = []
+        for path in sorted(self.by_name.get(key, ())):
+            for s in self.files[path]:
+                if key in self._names(s[0]):
+                    hits.append({'name': s[0], 'kind': s[1], 'path': path, 'line': s[2], 'definition': s[3]})
+        hits.sort(key=lambda h: (h['name'].lower() != key, h['path'], h['line']))
+        return hits[:limit]
+
+    def mentioned(self, words):
+        """The lookup hits for every word of a query that names a known symbol"""
+        hits, seen = [], set()
+        for w in words:
+            if w.lower() in seen or w.lower() not in self.by_name: continue
+            seen.add(w.lower()); hits.extend(self.lookup(w))
+        return hits
+
+    def state(self):
+        return {'symbols': np.frombuffer(json.dumps(self.files).encode('utf-8'), dtype=np.uint8)}
+
+    @classmethod
+    def from_state(cls, st):
+        return cls(json.loads(st['symbols'].tobytes().decode('utf-8')))
@@ -0,0 +1,203 @@
+import numpy as np
+
+
+def normalize(vecs):
+    """L2-normalizes the last axis so dot products are cosine similarities"""
+    norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+def _top_k(rows, sims, k):
+    k = min(k, len(rows))
+    top = np.argpartition(sims, -k)[-k:]
+    top = top[np.argsort(sims[top])[::-1]]
+    return rows[top], sims[top]
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index: rows are bucketed under their nearest k-means centroid
+    and a query only scans the `nprobe` closest buckets. Lists are stored CSR-style
+    (`order` holds row ids grouped by list, `offsets` marks where each list starts).
+    Rows appended after build() sit past `n_indexed` and are always scanned exactly.
+    """
+
+    def __init__(self, centroids, order, offsets, n_indexed):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.n_indexed = int(n_indexed)
+
+    @staticmethod
+    def _assign(x, centroids, batch=16384):
+        out = np.empty(len(x), dtype=np.int32)
+        for i in range(0, len(x), batch): out[i:i + batch] = np.argmax(x[i:i + batch] @ centroids.T, axis=1)
+        return out
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, iters=10, sample=64, seed=0):
+        n = len(matrix)
+        n_lists = min(n, n_lists or max(1, int(2 * np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        train = matrix[rng.choice(n, min(n, n_lists * sample), replace=False)]
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iters):
+            assign = cls._assign(train, centroids)
+            counts = np.bincount(assign, minlength=n_lists)
+            used = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[used]
+            sums = np.add.reduceat(train[np.argsort(assign, kind='stable')], starts, axis=0)
+            centroids[used] = normalize(sums)     # empty lists keep their old centroid
+
+        assign = cls._assign(matrix, centroids)
+        order = np.argsort(assign, kind='stable').astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists)))).astype(np.int64)
+        return cls(centroids, order, offsets, n)
+
+    def state(self):
+        return {'centroids': self.centroids, 'order': self.order, 'offsets': self.offsets, 'n_indexed': np.array(self.n_indexed)}
+
+    @classmethod
+    def from_state(cls, st):
+        return cls(st['centroids'], st['order'], st['offsets'], int(st['n_indexed']))
+
+    def remap(self, keep):
+        """Rewrites row ids after VectorStore.compact() kept only the rows in `keep`"""
+        new_id = np.full(max(self.n_indexed, int(keep[-1]) + 1 if len(keep) else 0), -1, dtype=np.int64)
+        new_id[keep] = np.arange(len(keep))
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        ids = new_id[self.order]
+        mask = ids >= 0
+        self.order = ids[mask]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(lists[mask], minlength=len(self.centroids)))))
+        self.n_indexed = int(np.count_nonzero(new_id[:self.n_indexed] >= 0))
+
+    def search(self, matrix, alive, q, k, nprobe=16):
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(self.centroids @ q, -nprobe)[-nprobe:]
+        parts = [self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe]
+        parts.append(np.arange(self.n_indexed, len(matrix)))
+        rows = np.concatenate(parts)
+        rows = rows[alive[rows]]
+        if not len(rows): return rows, np.zeros(0, dtype=np.float32)
+        return _top_k(rows, matrix[rows] @ q, k)
+
+
+class VectorStore:
+    """
+    Float32 embedding matrix with spare capacity. Appends double the buffer when it
+    fills up, so they are O(1) amortized; deletes only flag a tombstone until compact().
+    Rows are L2-normalized on the way in, so search() scores are cosine similarities.
+    search() goes through `index` (an IVFIndex) once one has been built, else brute force.
+    Row i always lines up with chunks[i] / sources[i] on the brain. Rows below `size` are
+    never written in place, so a view of `matrix` stays valid while rows are appended;
+    compact() moves rows into a new buffer and bumps `epoch`.
+    """
+
+    def __init__(self, vectors=None, capacity=1024):
+        self.min_capacity = capacity
+        self.clear()
+        if vectors is not None and len(vectors):
+            self.min_capacity = len(vectors)
+            self.append(vectors)
+
+    def clear(self):
+        self.buf = None
+        self.alive_buf = None
+        self.size = 0          # rows in use, tombstones included
+        self.live = 0          # rows not deleted
+        self.index = None
+        self.epoch = 0         # bumped whenever row ids change
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Adopts rows that are already normalized (e.g. a snapshot memmap) without copying them"""
+        vs = cls()
+        vs.buf = matrix
+        vs.alive_buf = np.ones(len(matrix), dtype=bool)
+        vs.size = vs.live = len(matrix)
+        return vs
+
+    def detach(self):
+        """Copies memory-mapped arrays into RAM so their backing file can be replaced"""
+        if isinstance(self.buf, np.memmap): self.buf = np.array(self.buf)
+        if self.index is not None:
+            for name in ('centroids', 'order', 'offsets'): setattr(self.index, name, np.array(getattr(self.index, name)))
+
+    def __len__(self): return self.size
+
+    @property
+    def dim(self): return 0 if self.buf is None else self.buf.shape[1]
+
+    @property
+    def matrix(self):
+        if self.buf is None: return np.zeros((0, 0), dtype=np.float32)
+        return self.buf[:self.size]
+
+    @property
+    def alive(self):
+        if self.buf is None: return np.zeros(0, dtype=bool)
+        return self.alive_buf[:self.size]
+
+    def _reserve(self, rows, dim):
+        if self.buf is None:
+            cap = max(self.min_capacity, rows)
+            self.buf = np.empty((cap, dim), dtype=np.float32)
+            self.alive_buf = np.zeros(cap, dtype=bool)
+            return
+        if self.size + rows <= len(self.buf): return
+        cap = max(len(self.buf), 1)
+        while cap < self.size + rows: cap *= 2
+        buf = np.empty((cap, dim), dtype=np.float32); buf[:self.size] = self.buf[:self.size]
+        alive = np.zeros(cap, dtype=bool); alive[:self.size] = self.alive_buf[:self.size]
+        self.buf, self.alive_buf = buf, alive
+
+    def append(self, vectors):
+        """Adds rows and returns the index of the first one"""
+        vecs = np.asarray(vectors, dtype=np.float32)
+        if vecs.ndim == 1: vecs = vecs[None, :]
+        vecs = normalize(vecs)
+        if self.buf is not None and vecs.shape[1] != self.dim:
+            raise ValueError(f"Embedding size {vecs.shape[1]} does not match brain ({self.dim})")
+        self._reserve(len(vecs), vecs.shape[1])
+        start = self.size
+        self.buf[start:start + len(vecs)] = vecs
+        self.alive_buf[start:start + len(vecs)] = True
+        self.size += len(vecs); self.live += len(vecs)
+        return start
+
+    def delete(self, rows):
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if not len(rows): return
+        rows = rows[self.alive_buf[rows]]
+        self.alive_buf[rows] = False
+        self.live -= len(rows)
+
+    def compact(self):
+        """Squeezes out tombstoned rows and returns the indices of the rows that were kept"""
+        keep = np.flatnonzero(self.alive)
+        if len(keep) == self.size: return keep
+        self.buf, self.alive_buf = self.buf[keep], np.ones(len(keep), dtype=bool)   # copies: old views stay intact
+        if self.index is not None: self.index.remap(keep)
+        self.size = self.live = len(keep)
+        self.epoch += 1
+        return keep
+
+    def build_index(self, n_lists=None):
+        self.index = IVFIndex.build(self.matrix, n_lists) if self.size else None
+
+    def index_is_stale(self, ratio=0.2):
+        """True when no index exists or too many rows were added since it was built"""
+        return self.index is None or self.size - self.index.n_indexed > ratio * self.index.n_indexed
+
+    def search(self, query, k=5, nprobe=16):
+        """Returns (rows, scores) of the k most similar live rows, best first"""
+        k = min(k, self.live)
+        if k <= 0: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        q = normalize(np.asarray(query, dtype=np.float32))
+        if self.index is not None:
+            rows, sims = self.index.search(self.matrix, self.alive, q, k, nprobe)
+            if len(rows) >= k: return rows, sims
+        sims = self.matrix @ q
+        if self.live < self.size: sims[~self.alive] = -np.inf
+        return _top_k(np.arange(self.size), sims, k)
@@ -3,39 +3,74 @@ import ollama
 import numpy as np
 import pickle
 import zipfile
+import io
+import hashlib
 import concurrent.futures
+from embedding import BatchEmbedder, EmbeddingCache, QueryEmbeddingCache
+from vector_store import VectorStore, IVFIndex
+from snapshot import write_snapshot, read_snapshot, is_snapshot
+from chunk_store import ChunkStore
+from lexical_index import LexicalIndex, tokenize, fuse
+from symbol_index import SymbolIndex, extract_symbols, definition_query, query_words, describe
+from chunker import split_code, count_tokens
+from context_packer import pack_context, fit_history
+from scanner import scan_files, map_bounded, is_binary
 
 class CoreBrain:
     def __init__(self):
-        self.chunks = []       
-        self.embeddings = []   
-        self.sources = []      
+        self.chunks = ChunkStore()     # chunk text + source path per row
+        self.embeddings = VectorStore()
+        self.lexical = LexicalIndex()  # BM25 over identifiers, rows aligned with chunks
+        self.symbols = SymbolIndex()   # function/class definitions per source file
         self.chat_history = [] 
+        self.manifest = {}     # path -> (size, mtime, sha256) of the file as last indexed
         self.model = "llama3.1"
+        self.top_k = 5
+        self.chunk_tokens = 512   # budget per chunk; whole definitions are packed up to it
+        self.num_ctx = 4096       # Ollama context window; the prompt is packed to fit it
+        self.answer_tokens = 768  # kept free for the reply
+        self.context_tokens = 2560  # retrieved code, at most
+        self.history_tokens = 768   # recent chat turns, at most
+        self.fusion_depth = 4     # each retriever proposes top_k * this many rows before fusion
+        self.nprobe = 16          # IVF lists scanned per query: higher = better recall, slower
+        self.ann_min_rows = 50000 # below this, exact search is fast enough
         self.embed_file = "temp_vectors.npy"
         self.meta_file = "temp_metadata.pkl"
+        self.cache_file = "embed_cache.db"
+        self.embedder = BatchEmbedder(batch_size=32, workers=4, cache=EmbeddingCache(self.cache_file))
+        self.query_embedder = QueryEmbeddingCache(max_entries=1024)
 
-    def _read_file(self, file_path):
-        """Read a single file and split into chunks"""
+    def _split_text(self, content, file_path, symbols=None):
+        """Split file contents into chunks at definition boundaries"""
+        return split_code(content, file_path, self.chunk_tokens, symbols=symbols)
+
+    def _load_file(self, file_path):
+        """Read, fingerprint and split a file. Returns (path, (size, mtime, sha256), chunks, symbols)"""
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            if not content.strip(): return []
-            
-            # Intelligent splitting
-            raw = content.split('\n\n')
-            chunks = []
-            current_chunk = ""
-            for r in raw:
-                if len(current_chunk) + len(r) < 1000:
-                    current_chunk += r + "\n\n"
-                else:
-                    chunks.append(current_chunk)
-                    current_chunk = r + "\n\n"
-            if current_chunk: chunks.append(current_chunk)
-            
-            return [(c, file_path) for c in chunks if len(c) > 50]
-        except: return []
+            st = os.stat(file_path)
+            with open(file_path, 'rb') as f: raw = f.read()
+            fp = (st.st_size, st.st_mtime, hashlib.sha256(raw).hexdigest())
+            if is_binary(raw): return file_path, fp, [], []
+            content = raw.decode('utf-8', errors='ignore')
+            syms = extract_symbols(content, file_path)
+            return file_path, fp, self._split_text(content, file_path, syms), syms
+        except: return file_path, None, [], []
+
+    def _scan_files(self, folder_path):
+        allowed_ext = {'.py', '.js', '.ts', '.c', '.cpp', '.java', '.md', '.txt', '.html', '.css', '.json', '.rs', '.go'}
+        return scan_files(folder_path, allowed_ext)
+
+    def _drop_sources(self, paths):
+        """Tombstone every chunk row that came from one of `paths`"""
+        if not paths: return
+        self.embeddings.delete(self.chunks.rows_for(paths))
+        self.symbols.drop(paths)
+        if self.embeddings.live < len(self.embeddings) // 2: self._compact()
+
+    def _compact(self):
+        keep = self.embeddings.compact()
+        if len(keep) < len(self.chunks): self.chunks = self.chunks.take(keep)
+        if len(keep) < len(self.lexical): self.lexical.remap(keep)
 
     def ingest_codebase(self, folder_path, callback_fn, append_mode=False):
         """
@@ -43,106 +78,213 @@ class CoreBrain:
         """
         # 1. Manage Memory State
         if not append_mode:
-            self.chunks = []
-            self.embeddings = []
-            self.sources = []
+            self.chunks = ChunkStore()
+            self.embeddings = VectorStore()
+            self.lexical = LexicalIndex()
+            self.symbols = SymbolIndex()
             self.chat_history = [] 
+            self.manifest = {}
             existing_sources = set()
             callback_fn("🧹 Memory cleared. Starting fresh scan...")
         else:
-            existing_sources = set(self.sources)
-            callback_fn(f"🔗 Appending to existing {len(self.sources)} files...")
-        
-        # 2. Recursive Scan
-        files_to_process = []
-        allowed_ext = {'.py', '.js', '.ts', '.c', '.cpp', '.java', '.md', '.txt', '.html', '.css', '.json', '.rs', '.go'}
+            existing_sources = self.chunks.live_sources(self.embeddings.alive)
+            callback_fn(f"🔗 Appending to existing {len(existing_sources)} files...")
         
-        for root, dirs, files in os.walk(folder_path):
-            if any(x in root for x in ['node_modules', '.git', 'venv', '__pycache__', 'build', 'dist', 'target']):
-                continue
-            for f in files:
-                if os.path.splitext(f)[1] in allowed_ext:
-                    full_path = os.path.join(root, f)
-                    if full_path not in existing_sources:
-                        files_to_process.append(full_path)
-
-        if not files_to_process: return "No new valid files found."
-
-        # 3. Parallel Read
-        callback_fn(f"📖 Reading {len(files_to_process)} new files...")
+        # 2. Parallel scan, with paths streamed into the reader pool as they are found
+        callback_fn("📖 Scanning and reading files...")
+        files_to_process = (p for p in self._scan_files(folder_path) if p not in existing_sources)
+        all_data = []
+        fps = {}
+        for path, fp, chunks, syms in map_bounded(self._load_file, files_to_process):
+            if fp: fps[path] = fp
+            self.symbols.set_file(path, syms)
+            all_data.extend(chunks)
+        if not fps: return "No new valid files found."
+
+        # 3. Embed; a file only enters the manifest once all of its chunks made it in
+        failed = self._embed_data(all_data, callback_fn)
+        self.manifest.update({p: fp for p, fp in fps.items() if p not in failed})
+        self.symbols.drop(failed)
+        if failed: return self._embed_failure(failed, f"Added {len(fps) - len(failed)} files.")
+        return f"Success: Added {len(fps)} files."
+
+    def sync_codebase(self, folder_path, callback_fn):
+        """
+        Incremental refresh: re-indexes files whose size/mtime/hash changed since
+        the last run and drops rows for files that no longer exist.
+        """
+        callback_fn("🔄 Checking for changes...")
+        current = set(self._scan_files(folder_path))
+        prefix = os.path.join(folder_path, '')
+        indexed = set(self.manifest) | self.chunks.live_sources(self.embeddings.alive)
+        deleted = {p for p in indexed if p.startswith(prefix) and p not in current}
+
+        candidates = []
+        for path in current:
+            old = self.manifest.get(path)
+            try: st = os.stat(path)
+            except OSError: continue
+            if old and old[0] == st.st_size and old[1] == st.st_mtime: continue
+            candidates.append(path)
+
+        # Size/mtime moved: confirm with the content hash before re-embedding
+        modified = {}
         all_data = []
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = executor.map(self._read_file, files_to_process)
-            for res in results: all_data.extend(res)
+            for path, fp, chunks, syms in executor.map(self._load_file, candidates):
+                if not fp: continue
+                old = self.manifest.get(path)
+                if old and old[2] == fp[2]: self.manifest[path] = fp; continue
+                modified[path] = (fp, syms)
+                all_data.extend(chunks)
 
-        # 4. Embed
-        total = len(all_data)
-        callback_fn(f"🧠 Embedding {total} new chunks...")
-        
+        if not deleted and not modified: return "Success: Already up to date."
+        callback_fn(f"♻️ {len(modified)} changed, {len(deleted)} deleted files...")
+        # Embed before touching the index: a file whose new chunks did not all embed keeps
+        # its old rows and old manifest entry, so the next Refresh tries it again
+        vectors = self._embed_chunks(all_data, callback_fn)
+        failed = {path for (_, path), vec in zip(all_data, vectors) if vec is None}
+        done = {p: fp for p, fp in modified.items() if p not in failed}
+        self._drop_sources(deleted | set(done))
+        for path in deleted: self.manifest.pop(path, None)
+        for path, (fp, syms) in done.items(): self.manifest[path] = fp; self.symbols.set_file(path, syms)
+        self._append_rows([(d, v) for d, v in zip(all_data, vectors) if d[1] not in failed], callback_fn)
+        if failed: return self._embed_failure(failed, f"Synced {len(done)} changed and {len(deleted)} deleted files.")
+        return f"Success: Synced {len(modified)} changed and {len(deleted)} deleted files."
+
+    def _embed_failure(self, failed, done_msg):
+        return f"⚠️ {len(failed)} files could not be embedded (is Ollama running?) and will be retried on the next Refresh. {done_msg}"
+
+    def _embed_chunks(self, data_tuples, callback_fn):
+        callback_fn(f"🧠 Embedding {len(data_tuples)} new chunks...")
+        return self.embedder.embed(self.model, [c for c, _ in data_tuples], callback_fn)
+
+    def _embed_data(self, data_tuples, callback_fn):
+        """Embeds and appends chunks; returns the paths that had a chunk fail to embed"""
+        vectors = self._embed_chunks(data_tuples, callback_fn)
+        failed = {path for (_, path), vec in zip(data_tuples, vectors) if vec is None}
+        self._append_rows(list(zip(data_tuples, vectors)), callback_fn)
+        return failed
+
+    def _append_rows(self, rows, callback_fn):
         new_embeds = []
-        for i, (chunk, path) in enumerate(all_data):
-            try:
-                self.chunks.append(chunk)
-                self.sources.append(path)
-                
-                response = ollama.embeddings(model=self.model, prompt=chunk)
-                new_embeds.append(response['embedding'])
-
-                if i % 10 == 0:
-                    prog = int((i / total) * 100)
-                    callback_fn(f"⚡ Processing: {prog}%")
-            except: pass
-
-        if new_embeds:
-            new_embeds_np = np.array(new_embeds)
-            if len(self.embeddings) > 0:
-                self.embeddings = np.concatenate((self.embeddings, new_embeds_np), axis=0)
-            else:
-                self.embeddings = new_embeds_np
-
-        return f"Success: Added {len(files_to_process)} files."
+        new_tokens = []
+        for (chunk, path), vec in rows:
+            if vec is None: continue
+            self.chunks.append(chunk, path)
+            new_embeds.append(vec)
+            new_tokens.append(tokenize(chunk))
+
+        if new_embeds: self.embeddings.append(new_embeds)
+        self.lexical.add(new_tokens)
+        self._refresh_index(callback_fn)
+
+    def _refresh_index(self, callback_fn):
+        if self.lexical.merge_is_due(): self.lexical.merge()
+        if self.embeddings.live < self.ann_min_rows: self.embeddings.index = None; return
+        if self.embeddings.index_is_stale():
+            callback_fn(f"🗂️ Building ANN index over {self.embeddings.live} chunks...")
+            self.embeddings.build_index()
+
+    def _replace_file(self, tmp_path, filepath):
+        try: os.replace(tmp_path, filepath)
+        except PermissionError:
+            # Windows refuses to replace a file that is still memory-mapped
+            self.embeddings.detach(); self.chunks.detach(); self.lexical.detach(); os.replace(tmp_path, filepath)
 
     def save_snapshot(self, filepath):
         try:
-            np.save(self.embed_file, self.embeddings)
-            with open(self.meta_file, 'wb') as f:
-                pickle.dump({'chunks': self.chunks, 'sources': self.sources, 'history': self.chat_history}, f)
-            with zipfile.ZipFile(filepath, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-                zf.write(self.embed_file)
-                zf.write(self.meta_file)
+            self._compact()
+            meta = pickle.dumps({'history': self.chat_history, 'manifest': self.manifest})
+            sections = {'vectors': self.embeddings.matrix, 'meta': np.frombuffer(meta, dtype=np.uint8), **self.chunks.sections()}
+            if self.embeddings.index is not None:
+                sections.update({f"ann_{k}": v for k, v in self.embeddings.index.state().items()})
+            sections.update({f"lex_{k}": v for k, v in self.lexical.state().items()})
+            sections.update(self.symbols.state())
+            write_snapshot(filepath + ".tmp", sections)
+            self._replace_file(filepath + ".tmp", filepath)
             return "Success"
         except Exception as e: return str(e)
 
     def load_snapshot(self, filepath):
         try:
-            with zipfile.ZipFile(filepath, 'r') as zf: zf.extractall(".")
-            self.embeddings = np.load(self.embed_file)
-            with open(self.meta_file, 'rb') as f:
-                data = pickle.load(f)
-                self.chunks = data['chunks']
-                self.sources = data['sources']
-                self.chat_history = data.get('history', [])
+            if not is_snapshot(filepath): return self._load_zip_snapshot(filepath)
+            s = read_snapshot(filepath)
+            data = pickle.loads(s['meta'].tobytes()) if 'meta' in s else {}   # team-server brains carry no meta
+            self.embeddings = VectorStore.from_matrix(s['vectors'])
+            if 'ann_centroids' in s:
+                self.embeddings.index = IVFIndex.from_state({k[4:]: v for k, v in s.items() if k.startswith('ann_')})
+            if 'chunk_blob' in s: self.chunks = ChunkStore.from_sections(s)
+            else: self.chunks = ChunkStore.from_lists(data['chunks'], data['sources'])
+            if 'lex_terms' in s: self.lexical = LexicalIndex.from_state({k[4:]: v for k, v in s.items() if k.startswith('lex_')})
+            else: self.lexical = LexicalIndex.build(self.chunks[i] for i in range(len(self.chunks)))
+            self.symbols = SymbolIndex.from_state(s) if 'symbols' in s else SymbolIndex()
+            self._set_meta(data)
             return f"Success: Loaded {len(self.chunks)} chunks."
         except Exception as e: return str(e)
 
+    def _load_zip_snapshot(self, filepath):
+        """Reads the original zip(npy + pickle) .brain format"""
+        with zipfile.ZipFile(filepath, 'r') as zf:
+            vecs = np.load(io.BytesIO(zf.read(self.embed_file)))
+            data = pickle.loads(zf.read(self.meta_file))
+        self.embeddings = VectorStore(vecs)
+        self.chunks = ChunkStore.from_lists(data['chunks'], data['sources'])
+        self.lexical = LexicalIndex.build(data['chunks'])
+        self.symbols = SymbolIndex()
+        self._set_meta(data)
+        return f"Success: Loaded {len(self.chunks)} chunks."
+
+    def _set_meta(self, data):
+        self.chat_history = data.get('history', [])
+        self.manifest = data.get('manifest', {})
+
+    def find_symbol(self, name, limit=50):
+        """Where `name` is defined: [{name, kind, path, line, definition}]"""
+        return self.symbols.lookup(name, limit)
+
+    def _definition_rows(self, hits, limit=20):
+        """Live chunk rows holding the definition line of each hit"""
+        wanted = {}
+        for h in hits[:limit]: wanted.setdefault(h['path'], []).append(h['definition'].encode('utf-8', errors='ignore'))
+        alive = self.embeddings.alive
+        return [i for path, defs in wanted.items() for i in self.chunks.find_in_source(path, defs) if alive[i]]
+
+    def _budget_prompt(self, preamble, query, history):
+        """Returns (history messages to send, tokens left for retrieved context)"""
+        hist = fit_history(history, self.history_tokens)
+        spent = count_tokens(preamble) + count_tokens(query) + sum(count_tokens(m['content']) + 4 for m in hist)
+        return hist, max(0, min(self.context_tokens, self.num_ctx - self.answer_tokens - spent))
+
     def ask_question(self, query):
-        if not self.chunks: return "Please load a codebase first.", []
+        if not self.chunks or self.embeddings.live == 0: return "Please load a codebase first.", []
 
-        query_vec = np.array(ollama.embeddings(model=self.model, prompt=query)['embedding'])
-        similarities = np.dot(self.embeddings, query_vec)
-        top_indices = np.argsort(similarities)[-5:][::-1]
+        # "where is X defined?" is answered from the symbol table, no LLM call
+        name = definition_query(query)
+        hits = self.find_symbol(name) if name else []
+        if hits:
+            ans = describe(name, hits)
+            self.chat_history.append({'role': 'user', 'content': query})
+            self.chat_history.append({'role': 'assistant', 'content': ans})
+            return ans, list(dict.fromkeys(h['path'] for h in hits))
 
-        relevant_chunks = [self.chunks[i] for i in top_indices]
-        relevant_sources = [self.sources[i] for i in top_indices]
-        
-        context_text = "\n\n".join(relevant_chunks)
+        query_vec = self.query_embedder.embed(self.model, query)
+        depth = self.top_k * self.fusion_depth
+        vec_rows, _ = self.embeddings.search(query_vec, depth, self.nprobe)
+        lex_rows, _ = self.lexical.search(query, self.embeddings.alive, depth)
+        sym_rows = self._definition_rows(self.symbols.mentioned(query_words(query)))
+        ranked = fuse([vec_rows, lex_rows, sym_rows], depth)
+
+        preamble = "You are an expert Developer. Answer using ONLY this context:\n"
+        recent, budget = self._budget_prompt(preamble, query, self.chat_history)
+        context_text, _, relevant_sources = pack_context([(i, self.chunks.source(i), self.chunks[i]) for i in ranked], budget)
         
-        messages = [{'role': 'system', 'content': f"You are an expert Developer. Answer using ONLY this context:\n{context_text}"}]
-        messages.extend(self.chat_history[-4:]) 
+        messages = [{'role': 'system', 'content': preamble + context_text}]
+        messages.extend(recent) 
         messages.append({'role': 'user', 'content': query})
 
         try:
-            response = ollama.chat(model=self.model, messages=messages)
+            response = ollama.chat(model=self.model, messages=messages, options={'num_ctx': self.num_ctx})
             ans = response['message']['content']
             self.chat_history.append({'role': 'user', 'content': query})
             self.chat_history.append({'role': 'assistant', 'content': ans})
@@ -0,0 +1,157 @@
+import re
+from array import array
+from collections import Counter
+import numpy as np
+
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_PARTS = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text):
+    """Identifier-aware terms: `getUser_id` -> getuser_id, get, user, id (lowercased, 2+ chars)"""
+    out = []
+    for word in _IDENT.findall(text):
+        if len(word) > 1: out.append(word.lower())
+        parts = _PARTS.findall(word)
+        if len(parts) > 1: out.extend(p.lower() for p in parts if len(p) > 1)
+    return out
+
+
+def fuse(rankings, k, c=60):
+    """Reciprocal rank fusion of several best-first row lists"""
+    scores = {}
+    for ranked in rankings:
+        for rank, row in enumerate(ranked): scores[int(row)] = scores.get(int(row), 0.0) + 1.0 / (c + rank + 1)
+    return np.array(sorted(scores, key=scores.get, reverse=True)[:k], dtype=np.int64)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over identifier tokens, one document per chunk row.
+    Postings live in a CSR block (`offsets` per term id into `rows`/`tfs`) plus an in-memory
+    tail for rows added since the last merge(); search() reads both. Deleted rows are filtered
+    with the VectorStore alive mask and only leave the postings in remap().
+    """
+    k1 = 1.2
+    b = 0.75
+    max_df = 0.5      # on big brains, terms in more than half the chunks are skipped: no signal, long lists
+
+    def __init__(self, terms=None, offsets=None, rows=None, tfs=None, doc_len=None):
+        self.terms = list(terms or [])
+        self.term_ids = {t: i for i, t in enumerate(self.terms)}
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self.rows = np.zeros(0, dtype=np.int64) if rows is None else rows
+        self.tfs = np.zeros(0, dtype=np.float32) if tfs is None else tfs
+        self.doc_len = array('i') if doc_len is None else doc_len
+        self.total_len = int(np.asarray(self.doc_len, dtype=np.int64).sum())
+        self.tail = {}           # term id -> (rows, tfs) lists not merged yet
+        self.tail_size = 0
+
+    @classmethod
+    def build(cls, texts):
+        idx = cls()
+        idx.add(tokenize(t) for t in texts)
+        idx.merge()
+        return idx
+
+    def __len__(self): return len(self.doc_len)
+
+    def add(self, token_lists):
+        """Appends one document per token list; rows continue from len(self)"""
+        if not isinstance(self.doc_len, array): self.doc_len = array('i', np.asarray(self.doc_len, dtype=np.int32).tobytes())
+        for toks in token_lists:
+            row = len(self.doc_len)
+            self.doc_len.append(len(toks)); self.total_len += len(toks)
+            counts = Counter(toks)
+            for t, n in counts.items():
+                tid = self.term_ids.get(t)
+                if tid is None:
+                    tid = self.term_ids[t] = len(self.terms)
+                    self.terms.append(t)
+                r, f = self.tail.setdefault(tid, ([], []))
+                r.append(row); f.append(n)
+            self.tail_size += len(counts)
+
+    def merge_is_due(self): return self.tail_size > max(len(self.rows) // 4, 1)
+
+    def _term_column(self):
+        return np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+
+    def merge(self):
+        """Folds the tail into the CSR block"""
+        if not self.tail: return
+        tids = np.concatenate([np.full(len(r), tid, dtype=np.int64) for tid, (r, _) in self.tail.items()])
+        terms = np.concatenate([self._term_column(), tids])
+        rows = np.concatenate([self.rows, np.concatenate([r for r, _ in self.tail.values()]).astype(np.int64)])
+        tfs = np.concatenate([self.tfs, np.concatenate([f for _, f in self.tail.values()]).astype(np.float32)])
+        order = np.argsort(terms, kind='stable')
+        self.rows, self.tfs = rows[order], tfs[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(terms, minlength=len(self.terms))))).astype(np.int64)
+        self.tail = {}; self.tail_size = 0
+
+    def _postings(self, tid):
+        rows, tfs = [], []
+        if tid < len(self.offsets) - 1:
+            a, b = self.offsets[tid], self.offsets[tid + 1]
+            rows.append(self.rows[a:b]); tfs.append(self.tfs[a:b])
+        if tid in self.tail:
+            r, f = self.tail[tid]
+            rows.append(np.asarray(r, dtype=np.int64)); tfs.append(np.asarray(f, dtype=np.float32))
+        if not rows: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(rows), np.concatenate(tfs)
+
+    def search(self, query, alive=None, k=20):
+        """Returns (rows, scores) of the k best BM25 matches, best first"""
+        n = len(self.doc_len)
+        tids = {self.term_ids[t] for t in tokenize(query) if t in self.term_ids}
+        if not n or not tids: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        doc_len = np.asarray(self.doc_len, dtype=np.int32)
+        avgdl = max(self.total_len / n, 1.0)
+        hit_rows, hit_w = [], []
+        for tid in tids:
+            rows, tfs = self._postings(tid)
+            df = len(rows)
+            if not df or (n >= 1000 and df > n * self.max_df): continue
+            idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[rows] / avgdl)
+            hit_rows.append(rows); hit_w.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not hit_rows: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows, w = np.concatenate(hit_rows), np.concatenate(hit_w)
+        if alive is not None:
+            keep = alive[rows]; rows, w = rows[keep], w[keep]
+        rows, inv = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inv, weights=w)
+        k = min(k, len(rows))
+        if not k: return rows, scores
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return rows[top], scores[top]
+
+    def remap(self, keep):
+        """Rewrites row ids after a compaction kept only the rows in `keep`"""
+        self.merge()
+        new_id = np.full(len(self.doc_len), -1, dtype=np.int64)
+        new_id[keep] = np.arange(len(keep))
+        terms = self._term_column()
+        rows = new_id[self.rows]
+        m = rows >= 0
+        self.rows, self.tfs = rows[m], self.tfs[m]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(terms[m], minlength=len(self.terms))))).astype(np.int64)
+        doc_len = np.asarray(self.doc_len, dtype=np.int32)[keep]
+        self.doc_len = array('i', doc_len.tobytes()); self.total_len = int(doc_len.sum())
+
+    def detach(self):
+        """Copies memory-mapped arrays into RAM so their backing file can be replaced"""
+        self.offsets, self.rows, self.tfs = np.array(self.offsets), np.array(self.rows), np.array(self.tfs)
+        if not isinstance(self.doc_len, array): self.doc_len = array('i', np.asarray(self.doc_len, dtype=np.int32).tobytes())
+
+    def state(self):
+        self.merge()
+        return {'terms': np.frombuffer("\0".join(self.terms).encode('utf-8'), dtype=np.uint8),
+                'offsets': self.offsets, 'rows': self.rows, 'tfs': self.tfs,
+                'doc_len': np.array(self.doc_len, dtype=np.int32)}
+
+    @classmethod
+    def from_state(cls, st):
+        terms = st['terms'].tobytes().decode('utf-8')
+        return cls(terms.split("\0") if terms else [], st['offsets'], st['rows'], st['tfs'], st['doc_len'])
@@ -64,6 +64,8 @@ class TaskWorker(QThread):
     def run(self):
         if self.task == "ingest": 
             res = self.brain.ingest_codebase(self.data, self.msg_signal.emit, self.append_mode)
+        elif self.task == "sync":
+            res = self.brain.sync_codebase(self.data, self.msg_signal.emit)
         elif self.task == "save": res = self.brain.save_snapshot(self.data)
         elif self.task == "load": res = self.brain.load_snapshot(self.data)
         elif self.task == "query": 
@@ -78,6 +80,7 @@ class CoreApp(QMainWindow):
         super().__init__()
         self.brain = CoreBrain()
         self.voice_thread = None
+        self.last_folder = None
         self.init_ui()
 
     def init_ui(self):
@@ -130,6 +133,10 @@ class CoreApp(QMainWindow):
         self.btn_new.setCursor(Qt.CursorShape.PointingHandCursor)
         self.btn_new.clicked.connect(self.do_ingest)
         
+        self.btn_refresh = QPushButton("🔄 Refresh")
+        self.btn_refresh.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_refresh.clicked.connect(self.do_refresh)
+
         self.btn_load = QPushButton("📂 Load")
         self.btn_load.setCursor(Qt.CursorShape.PointingHandCursor)
         self.btn_load.clicked.connect(self.do_load)
@@ -144,6 +151,7 @@ class CoreApp(QMainWindow):
         self.btn_call.clicked.connect(self.toggle_voice)
         
         h_layout.addWidget(self.btn_new)
+        h_layout.addWidget(self.btn_refresh)
         h_layout.addWidget(self.btn_load)
         h_layout.addWidget(self.btn_save)
         h_layout.addWidget(self.btn_call)
@@ -298,12 +306,23 @@ class CoreApp(QMainWindow):
         if folder:
             is_append = self.btn_mode.isChecked()
             if not is_append: self.chat_area.clear()
+            self.last_folder = folder
             self.set_state("Indexing...", "#ff9800")
             self.worker = TaskWorker(self.brain, "ingest", folder, append_mode=is_append)
             self.worker.msg_signal.connect(lambda s: self.status_pill.setText(s))
             self.worker.result_signal.connect(lambda s: self.finish(s))
             self.worker.start()
 
+    def do_refresh(self):
+        folder = self.last_folder or QFileDialog.getExistingDirectory(self, "Select Code to Refresh")
+        if folder:
+            self.last_folder = folder
+            self.set_state("Refreshing...", "#ff9800")
+            self.worker = TaskWorker(self.brain, "sync", folder)
+            self.worker.msg_signal.connect(lambda s: self.status_pill.setText(s))
+            self.worker.result_signal.connect(lambda s: self.finish(s))
+            self.worker.start()
+
     def do_save(self):
         path, _ = QFileDialog.getSaveFileName(self, "Save", "", "Brain (*.brain)")
         if path:
@@ -324,6 +343,9 @@ class CoreApp(QMainWindow):
         if "Success" in res or "Loaded" in res:
             self.unlock_ui()
             self.add_msg(f"✅ {res}", "ai")
+        elif res.startswith("⚠️"):    # partly done: the brain is usable, the rest retries on Refresh
+            self.unlock_ui()
+            self.add_msg(res, "ai")
         else:
             self.add_msg(f"❌ Error: {res}", "ai")
             self.set_state(" Error ", "#ff4444")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The apps are plain script folders with flat imports; the shared modules are identical in
+# both, so the tests import them from the Offline copy.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "CodeChat Offline"))
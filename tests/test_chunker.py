@@ -0,0 +1,53 @@
+import json
+from chunker import split_code, count_tokens
+from symbol_index import extract_symbols
+
+
+def body(chunk): return chunk.split("\n", 1)[1]
+
+
+def test_chunks_keep_definitions_whole():
+    src = "".join(f"def f{i}(x):\n    return x + {i}\n\n" for i in range(5))
+    out = split_code(src, "a.py", 512)
+    assert len(out) == 1
+    assert out[0][0].startswith("# File: a.py | Symbols: f0, f1, f2, f3, f4\n")
+
+
+def test_chunks_stay_within_budget_after_blank_line_cut():
+    src = "def f():\n    x = 1\n\n" + "    b = 1 + 2 + 3 + 4 + 5\n" * 25 + "    c = [" + "1, " * 140 + "]\n"
+    out = split_code(src, "x.py", 512)
+    assert len(out) > 1
+    assert max(count_tokens(c) for c, _ in out) <= 512   # header included
+
+
+def test_overlong_lines_are_cut_and_rejoined():
+    js = ";".join(f"var v{i}=function(x){{return x*{i}}}" for i in range(2000))
+    out = split_code(js, "m.min.js", 256)
+    assert len(out) > 1
+    assert max(count_tokens(c) for c, _ in out) <= 256
+    assert "".join(body(c) for c, _ in out) == js
+
+    blob = "A" * 20000            # one token, cut by characters
+    out = split_code(f"x = '{blob}'\n", "b.py", 256, min_chars=0)
+    assert sum(body(c).count("A") for c, _ in out) == 20000
+    assert max(count_tokens(c) for c, _ in out) <= 256
+
+
+def test_one_line_json_between_definitions():
+    src = "def load():\n    return 1\n\nCONFIG = " + json.dumps({f"k{i}": list(range(20)) for i in range(300)}) + "\n\ndef after():\n    return 2\n"
+    out = split_code(src, "c.py", 256)
+    assert max(count_tokens(c) for c, _ in out) <= 256
+    assert "def after():" in out[-1][0]
+
+
+def test_cr_only_line_endings():
+    src = "x = 1\rdef f():\r    pass\rclass K:\r    def m(self): pass\r"
+    assert [(s[0], s[2]) for s in extract_symbols(src, "old.py")] == [("f", 2), ("K", 4), ("K.m", 5)]
+    assert [s[0] for s in extract_symbols("function g(){}\rfunction h(){}", "old.js")] == ["g", "h"]
+    out = split_code(src, "old.py", 512, min_chars=0)
+    assert out and "Symbols: f, K, K.m" in out[0][0]
+
+
+def test_crlf_text_is_kept():
+    out = split_code("def a():\r\n    return 'crlf stays as it is'\r\n", "w.py", 512, min_chars=0)
+    assert "\r\n" in out[0][0]
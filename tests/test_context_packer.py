@@ -0,0 +1,47 @@
+from chunker import count_tokens
+from context_packer import pack_context, fit_history
+
+
+def chunk(path, text, symbols=""):
+    return f"# File: {path}" + (f" | Symbols: {symbols}" if symbols else "") + "\n" + text
+
+
+def test_repeated_chunk_is_packed_once():
+    c = chunk("a.py", "def a():\n    return 1", "a")
+    ctx, rows, sources = pack_context([(0, "a.py", c), (0, "a.py", c), (5, "a.py", c)], 1000)
+    assert ctx.count("def a():") == 1
+    assert rows == [0, 5] and sources == ["a.py"]
+
+
+def test_overlapping_and_adjacent_chunks_merge():
+    first = chunk("a.py", "line one is here\nline two is shared text\nline three", "one")
+    second = chunk("a.py", "line two is shared text\nline three\nline four", "two")
+    ctx, rows, _ = pack_context([(3, "a.py", first), (4, "a.py", second)], 1000)
+    assert ctx.count("line two is shared text") == 1
+    assert ctx.startswith("# File: a.py | Symbols: one, two\n")
+    assert sorted(rows) == [3, 4]
+
+    # rows 1 and 2 of the same file touch, so they become one piece in file order
+    ctx, _, _ = pack_context([(2, "b.py", chunk("b.py", "second part")), (1, "b.py", chunk("b.py", "first part"))], 1000)
+    assert ctx == "# File: b.py\nfirst part\nsecond part"
+
+
+def test_other_files_are_not_merged():
+    ctx, _, sources = pack_context([(1, "a.py", chunk("a.py", "x = 1")), (2, "b.py", chunk("b.py", "y = 2"))], 1000)
+    assert ctx.count("# File:") == 2 and sources == ["a.py", "b.py"]
+
+
+def test_budget_is_respected():
+    cands = [(i, f"f{i}.py", chunk(f"f{i}.py", " ".join(f"w{j}" for j in range(40)))) for i in range(10)]
+    ctx, rows, _ = pack_context(cands, 200)
+    assert count_tokens(ctx) <= 200 and 0 < len(rows) < 10
+    # a single chunk over budget is trimmed to the lines that fit rather than dropped
+    big = chunk("big.py", "\n".join(f"line {i} = {i}" for i in range(200)))
+    ctx, rows, _ = pack_context([(0, "big.py", big)], 100)
+    assert rows == [0] and count_tokens(ctx) <= 100
+
+
+def test_fit_history_keeps_newest():
+    hist = [{"role": "user", "content": f"message {i} " * 10} for i in range(6)]
+    kept = fit_history(hist, 60)
+    assert kept and kept[-1] is hist[-1] and len(kept) < 4
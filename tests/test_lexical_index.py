@@ -0,0 +1,41 @@
+import os
+import numpy as np
+from conftest import ROOT
+from lexical_index import LexicalIndex, tokenize, fuse
+
+SHARED = ["embedding", "vector_store", "snapshot", "chunk_store", "lexical_index", "symbol_index",
+          "chunker", "context_packer", "scanner"]
+
+
+def test_shared_modules_match_between_apps():
+    for name in SHARED:
+        with open(os.path.join(ROOT, "CodeChat Offline", name + ".py"), "rb") as a, \
+             open(os.path.join(ROOT, "CodeChat Collaborative", name + ".py"), "rb") as b:
+            assert a.read() == b.read(), name
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("getUser_id = 1") == ["getuser_id", "get", "user", "id"]
+
+
+def test_fuse_orders_by_reciprocal_rank():
+    # 3 is near the top of both lists, so it beats rows that lead only one of them
+    out = fuse([[1, 3, 5], [2, 3, 4]], k=10)
+    assert out[0] == 3
+    assert list(out[1:3]) == [1, 2]
+    assert set(out) == {1, 2, 3, 4, 5}
+
+
+def test_fuse_truncates_and_dedupes():
+    out = fuse([[7, 8, 9], [9, 8, 7], []], k=2)
+    assert len(out) == 2 and len(set(out)) == 2
+    assert out.dtype == np.int64
+
+
+def test_search_skips_deleted_rows():
+    idx = LexicalIndex.build(["def parse_invoice(doc)", "class Invoice", "print('hi')"])
+    rows, _ = idx.search("parse invoice")
+    assert rows[0] == 0
+    alive = np.array([False, True, True])
+    rows, _ = idx.search("parse invoice", alive)
+    assert 0 not in rows and list(rows) == [1]
@@ -0,0 +1,41 @@
+import os
+from scanner import scan_files, map_bounded, is_binary
+
+
+def write(root, rel, text="x = 1\n"):
+    path = os.path.join(root, *rel.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f: f.write(text)
+
+
+def found(root, **kw):
+    return sorted(os.path.relpath(p, root).replace(os.sep, "/") for p in scan_files(str(root), {".py", ".js"}, **kw))
+
+
+def test_gitignore_prunes_files_and_dirs(tmp_path):
+    write(tmp_path, ".gitignore", "# generated\n*.gen.py\nout/\n/top_only.py\n!keep.gen.py\n")
+    for rel in ["app.py", "a.gen.py", "keep.gen.py", "top_only.py", "sub/top_only.py", "out/x.py",
+                "sub/out/y.py", "sub/ok.js", "notes.txt"]:
+        write(tmp_path, rel)
+    write(tmp_path, "sub/.gitignore", "local.py\n")
+    write(tmp_path, "sub/local.py")
+    write(tmp_path, "local.py")
+    assert found(tmp_path) == ["app.py", "keep.gen.py", "local.py", "sub/ok.js", "sub/top_only.py"]
+    assert "out/x.py" in found(tmp_path, gitignore=False)
+
+
+def test_skip_dirs_and_size_limit(tmp_path):
+    write(tmp_path, "node_modules/lib.js")
+    write(tmp_path, ".git/hook.py")
+    write(tmp_path, "big.py", "x" * 5000)
+    write(tmp_path, "small.py")
+    assert found(tmp_path, max_bytes=1000) == ["small.py"]
+
+
+def test_map_bounded_keeps_order():
+    assert list(map_bounded(lambda x: x * 2, iter(range(100)), inflight=4)) == [x * 2 for x in range(100)]
+
+
+def test_is_binary():
+    assert is_binary(b"\x89PNG\r\n\x1a\n\0\0")
+    assert not is_binary("plain text é".encode("utf-8"))